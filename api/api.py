@@ -1,11 +1,297 @@
-from bottle import route, run, default_app
-import uuid 
+from bottle import route, run, default_app, request, response
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, FIRST_COMPLETED, wait
+import cProfile
+import gzip
+import json
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
 
 from connection import Connection
 from brewery import Brewery
 from beer_and_coords import BeerAndCoords
 from search_results import SearchResults
-from graph import Graph
+from graph import Graph, search_path, search_paths
+from graph_snapshot import load_snapshot, load_snapshots, graph_file_path
+from search_executor import SearchExecutor, SearchQueueFull
+from result_cache import ResultCache, SqliteResultCache
+from metrics import Metrics
+from shard_map import ShardMap, shard_map_path, shard_database_directory
+
+# Shards of the graph this backend serves and the urls of the backends of the other shards (name=url pairs),
+# without either of them the whole graph is served
+local_shards = [name for name in os.environ.get('SHARDS', '').split(',') if name != '']
+shard_backends = dict(backend.split('=', 1) for backend in os.environ.get('SHARD_BACKENDS', '').split(',') if backend != '')
+
+sharded = len(local_shards) > 0 or len(shard_backends) > 0
+
+if (sharded):
+    shard_map = ShardMap()
+    shard_map.load_file(shard_map_path('beer.db'))
+    database_directories = [shard_database_directory('beer.db', name) for name in local_shards]
+
+    # A backend has to serve every shard it was given, a missing one is a deployment error
+    for name in local_shards:
+        if (name not in shard_map.shards or not os.path.isfile(graph_file_path(shard_database_directory('beer.db', name)))):
+            raise FileNotFoundError('Shard ' + name + ' has no graph file, python graph.py -s writes the shards')
+else:
+    database_directories = ['beer.db']
+
+# Graph snapshots are loaded once per worker and shared by all requests
+load_snapshots(*database_directories)
+
+# Number of processes evaluating the genetic population, 1 runs the search in the request
+search_workers = int(os.environ.get('SEARCH_WORKERS', 1))
+
+# Parallel evaluation allows proportionally more runs in the same time
+maximum_runs = 20 * search_workers
+
+# Range in kilometres the graph was built for, requests can ask for any range up to it
+maximum_range = float(os.environ.get('MAXIMUM_RANGE', 1000))
+
+# Searches waiting for a search worker, requests that don't fit get a busy response
+search_queue_size = int(os.environ.get('SEARCH_QUEUE_SIZE', 16))
+
+# Seconds a search may take, then the best result so far is returned
+search_deadline = float(os.environ.get('SEARCH_DEADLINE', 20))
+
+# Executor is created on the first request, so its processes belong to the uWSGI worker and not the master
+search_executor = None
+
+# Requests are handled by several threads, only one of them creates the executor and the cache
+creation_lock = threading.Lock()
+
+def get_search_executor():
+    global search_executor
+
+    with creation_lock:
+        if (search_executor is None):
+            search_executor = SearchExecutor(search_workers, search_queue_size, initializer=load_snapshots, initargs=tuple(database_directories))
+
+    return search_executor
+
+# Queues carrying the improved results of streamed searches out of the search processes live in a manager process,
+# it is started on the first streamed request like the executor
+progress_manager = None
+
+def get_progress_manager():
+    global progress_manager
+
+    with creation_lock:
+        if (progress_manager is None):
+            progress_manager = multiprocessing.Manager()
+
+    return progress_manager
+
+def busy_json():
+    temp_result = SearchResults()
+    temp_result.reset()
+    return temp_result.return_in_json({'busy' : True})
+
+def busy_response(metrics=None):
+
+    if (metrics is not None):
+        metrics.count('busy_responses')
+        finish_metrics(metrics)
+
+    # Tells the client to retry instead of waiting for a search that can't start in time
+    response.status = 503
+    response.set_header('Retry-After', '1')
+
+    return busy_json()
+
+# Metrics of every request are added to the totals served at /api/metrics, ?debug=1 collects them for a single request
+metrics_enabled = os.environ.get('METRICS', '0') == '1'
+
+# Directory the ?profile=1 requests write their cProfile statistics to, profiling is disabled without it
+profile_directory = os.environ.get('PROFILE_DIRECTORY')
+
+# Totals of the uWSGI worker, requests of all threads add to them
+total_metrics = Metrics()
+metrics_lock = threading.Lock()
+
+def finish_metrics(metrics):
+
+    # Stage times of the request go into a header and everything is added to the totals
+    response.set_header('X-Timing', metrics.timing_header())
+
+    with metrics_lock:
+        total_metrics.merge(metrics)
+
+# Responses of at least this many bytes are gzip compressed for the clients that accept it, 0 disables compression
+gzip_minimum_size = int(os.environ.get('GZIP_MINIMUM_SIZE', 1024))
+gzip_level = int(os.environ.get('GZIP_LEVEL', 6))
+
+def accepts_gzip():
+
+    if (gzip_minimum_size <= 0):
+        return False
+
+    # Codings are separated by commas and weighted by their q-value, q=0 refuses one and * stands for the ones that aren't listed
+    qualities = {}
+
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        name, *parameters = [part.strip() for part in coding.split(';')]
+        quality = 1.0
+
+        for parameter in parameters:
+            attribute, separator, value = parameter.partition('=')
+
+            if (attribute.strip().lower() == 'q'):
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        qualities[name.lower()] = quality
+
+    return qualities.get('gzip', qualities.get('x-gzip', qualities.get('*', 0))) > 0
+
+def compress_json(result_in_json):
+
+    # Json that is long enough to be sent compressed, it is compressed once when the result is cached
+    if (gzip_minimum_size <= 0 or len(result_in_json) < gzip_minimum_size):
+        return None
+
+    return gzip.compress(result_in_json.encode('utf8'), compresslevel=gzip_level)
+
+def send_json(result_in_json, compressed=None):
+
+    # The same url is answered with and without compression
+    response.set_header('Vary', 'Accept-Encoding')
+
+    if (accepts_gzip() and len(result_in_json) >= gzip_minimum_size):
+        response.set_header('Content-Encoding', 'gzip')
+        return compressed if (compressed is not None) else compress_json(result_in_json)
+
+    return result_in_json
+
+def send_lines(lines):
+
+    # Every line is flushed out of the compressor, so the client can read the results as they arrive
+    response.set_header('Vary', 'Accept-Encoding')
+
+    if (not accepts_gzip()):
+        return lines
+
+    response.set_header('Content-Encoding', 'gzip')
+
+    def compress():
+        compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+        for line in lines:
+            yield compressor.compress(line.encode('utf8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        yield compressor.flush()
+
+    return compress()
+
+def stream_response(records, events=False):
+
+    # Records are Server-Sent Events or json lines, nginx passes them on as they arrive instead of buffering the response
+    response.content_type = 'text/event-stream' if (events) else 'application/x-ndjson'
+    response.set_header('Cache-Control', 'no-cache')
+    response.set_header('X-Accel-Buffering', 'no')
+
+    return send_lines(('data: ' + record + '\n\n' if events else record + '\n') for record in records)
+
+# Headers of the backend response that are passed on to the client
+forwarded_headers = ['Content-Type', 'Content-Encoding', 'Vary', 'Retry-After', 'X-Timing', 'X-Profile']
+
+def empty_response():
+    temp_result = SearchResults()
+    temp_result.reset()
+    return temp_result.return_in_json()
+
+def forward_request(shard, metrics=None):
+
+    # The backend of the shard answers the same url, its response is relayed as it is
+    if (metrics is not None):
+        metrics.count('forwarded_requests')
+        finish_metrics(metrics)
+
+    if (shard not in shard_backends):
+        return busy_response()
+
+    url = shard_backends[shard] + request.path + ('?' + request.query_string if request.query_string != '' else '')
+    forwarded = urllib.request.Request(url, headers={'Accept-Encoding' : request.headers.get('Accept-Encoding', '')})
+
+    try:
+        # The backend stops searching at its deadline, the slack covers the run in progress and the network
+        backend_response = urllib.request.urlopen(forwarded, timeout=search_deadline + 2)
+    except urllib.error.HTTPError as error:
+        backend_response = error
+    except OSError:
+        return busy_response()
+
+    response.status = backend_response.getcode()
+
+    for header in forwarded_headers:
+        if (backend_response.headers.get(header) is not None):
+            response.set_header(header, backend_response.headers.get(header))
+
+    # Streamed searches are relayed as their records arrive
+    if (backend_response.headers.get('X-Accel-Buffering') == 'no'):
+        response.set_header('Cache-Control', 'no-cache')
+        response.set_header('X-Accel-Buffering', 'no')
+
+        def relay():
+            with backend_response:
+                yield from iter(lambda: backend_response.read1(65536), b'')
+
+        return relay()
+
+    with backend_response:
+        return backend_response.read()
+
+def forward_points(shard, points, number_of_runs, seed):
+
+    # Points of the batch that belong to the shard of another backend are sent to it as one batch,
+    # the results are returned in the order of the points and the ones it didn't answer are None
+    results = [None] * len(points)
+
+    if (shard not in shard_backends):
+        return results
+
+    url = shard_backends[shard] + '/api/find-paths/' + str(number_of_runs) + ('' if seed is None else '?seed=' + str(seed))
+    body = ''.join(json.dumps({'lat' : latitude, 'long' : longitude}) + '\n' for latitude, longitude in points)
+
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=body.encode('utf8')), timeout=search_deadline + 2) as backend_response:
+            for line in backend_response:
+                index, result_in_json = read_batch_line(line.decode('utf8'))
+                results[index] = result_in_json
+    except OSError:
+        pass
+
+    return results
+
+# Result cache settings, size 0 disables the cache and a file shares it between the uWSGI workers
+result_cache_size = int(os.environ.get('RESULT_CACHE_SIZE', 1024))
+result_cache_time_to_live = float(os.environ.get('RESULT_CACHE_TTL', 3600))
+result_cache_quantization = float(os.environ.get('RESULT_CACHE_QUANTIZATION', 0.01))
+result_cache_file = os.environ.get('RESULT_CACHE_FILE')
+
+# Result cache is created on the first request, SQLite connections can't be shared across the fork
+result_cache = None
+
+def get_result_cache():
+    global result_cache
+
+    with creation_lock:
+        if (result_cache is None):
+            if (result_cache_file):
+                result_cache = SqliteResultCache(result_cache_file, result_cache_size, result_cache_time_to_live, result_cache_quantization)
+            else:
+                result_cache = ResultCache(result_cache_size, result_cache_time_to_live, result_cache_quantization)
+
+    return result_cache
 
 
 @route('/api/find-path/<latitude>/<longitude>/<number_of_runs>')
@@ -19,6 +305,10 @@ def generate_path(latitude, longitude, number_of_runs):
         longitude = float(longitude)
         number_of_runs = int(number_of_runs)
 
+        # Check if coordinates are numbers, nan isn't out of any range
+        if (not math.isfinite(latitude) or not math.isfinite(longitude)):
+            raise ValueError
+
         # Check if latitude is in range
         if (latitude < -90 or latitude > 90):
             raise ValueError
@@ -28,9 +318,44 @@ def generate_path(latitude, longitude, number_of_runs):
             raise ValueError
 
         # Check if number_of_runs is range
-        if (number_of_runs < 0 or number_of_runs > 20):
+        if (number_of_runs < 0 or number_of_runs > maximum_runs):
+            raise ValueError
+
+        # Optional seed makes the result reproducible
+        seed = request.query.get('seed')
+
+        if (seed is not None):
+            seed = int(seed)
+
+        # Optional time budget in milliseconds, the search improves the route until it is used up
+        budget = request.query.get('budget_ms')
+
+        if (budget is not None):
+            budget = int(budget)
+
+            if (budget <= 0):
+                raise ValueError
+
+        # Optional solver, the genetic algorithm or the beam search
+        solver = request.query.get('solver', 'genetic')
+
+        if (solver not in ('genetic', 'beam')):
             raise ValueError
 
+        # Optional range in kilometres, the candidate rows are sorted by length and only their start is used
+        maximum_distance = float(request.query.get('range', maximum_range))
+
+        if (not 0 < maximum_distance <= maximum_range):
+            raise ValueError
+
+        # Optional streaming of the improved results, as Server-Sent Events if the client asks for them
+        stream = request.query.get('stream') == '1'
+        events = 'text/event-stream' in request.headers.get('Accept', '')
+
+        # Optional instrumentation of the request
+        debug = request.query.get('debug') == '1'
+        profile = profile_directory is not None and request.query.get('profile') == '1'
+
     except ValueError:
         temp_result = SearchResults()
         temp_result.reset()
@@ -40,17 +365,447 @@ def generate_path(latitude, longitude, number_of_runs):
     latitude = float(latitude)
     longitude = float(longitude)
 
-    # generate home id
-    unique_id = uuid.uuid4().hex[:12]
+    metrics = Metrics() if (metrics_enabled or debug) else None
+
+    if (metrics is not None):
+        metrics.count('requests')
+
+    database_directory = 'beer.db'
+
+    # Start points are searched in the shard that covers them, the backends of the other shards are asked for theirs
+    if (sharded):
+        shard = shard_map.shard_for(latitude, longitude)
+
+        # No brewery is in reach of the start point
+        if (shard is None):
+            return empty_response()
+
+        if (shard not in local_shards):
+            return forward_request(shard, metrics)
+
+        database_directory = shard_database_directory('beer.db', shard)
+
+    # Return the cached result of the same query, instrumented requests always search
+    if (result_cache_size > 0):
+        cache_key = get_result_cache().key(latitude, longitude, number_of_runs, seed, budget, solver, maximum_distance)
+        cached_entry = get_result_cache().get_entry(cache_key) if (not debug and not profile) else None
+
+        if (cached_entry is not None):
+            cached_result, cached_compressed = cached_entry
+
+            if (metrics is not None):
+                metrics.count('cache_hits')
+                finish_metrics(metrics)
+
+            if (stream):
+                return stream_response([cached_result], events)
+
+            return send_json(cached_result, cached_compressed)
+
+    start = time.time()
+    stage_start = time.perf_counter()
+
+    profile_path = None
+
+    if (profile):
+        profile_path = os.path.join(profile_directory, 'find-path-' + str(time.time_ns()) + '.prof')
+        response.set_header('X-Profile', profile_path)
+
+    # A budget replaces the number of runs, it can't be longer than the deadline
+    if (budget is not None):
+        deadline = start + min(budget / 1000, search_deadline)
+        number_of_runs = None
+    else:
+        deadline = start + search_deadline
+
+    def finish_search(result, completed_runs, converged, beam_levels=None):
+
+        # Returns the json of the result and its compressed json if it was cached, None if nothing was searched before the deadline
+        if (metrics is not None):
+            metrics.record_time('search', stage_start)
 
-    # create graph object
-    graph = Graph('beer.db', home_id=unique_id, weight=0.504597714410906)
+        if (completed_runs == 0 and number_of_runs != 0 and not beam_levels):
+            return None
 
-    # find path
-    result = graph.genetic_near_neighbour(number_of_runs, latitude, longitude)
+        # A search that converged is complete, more runs wouldn't find other routes
+        complete = converged or completed_runs == number_of_runs
+
+        # Budgeted searches report how much they did
+        if (number_of_runs is None):
+            metadata = {'iterations' : completed_runs, 'elapsed_ms' : round((time.time() - start) * 1000)}
+
+        # Partial results aren't cached, a later request can do better
+        elif (not complete):
+            metadata = {'partial' : True, 'completed_runs' : completed_runs}
+
+            # A beam cut off by the deadline finished no runs, the levels it expanded tell how far it got
+            if (beam_levels is not None):
+                metadata['beam_levels'] = beam_levels
+
+        else:
+            metadata = None
+
+        json_start = time.perf_counter()
+        result_in_json = result.return_in_json(metadata)
+        compressed = None
+
+        # Cached results are compressed once, hits send the same bytes
+        if (result_cache_size > 0 and number_of_runs is not None and complete):
+            compressed = compress_json(result_in_json)
+            get_result_cache().put(cache_key, result_in_json, compressed)
+
+        # A budgeted result is cached without the elapsed_ms of the search, a hit doesn't spend that time
+        elif (result_cache_size > 0 and number_of_runs is None):
+            cached_json = result.return_in_json({'iterations' : completed_runs})
+            get_result_cache().put(cache_key, cached_json, compress_json(cached_json))
+
+        if (metrics is not None):
+            metrics.record_time('json', json_start)
+            finish_metrics(metrics)
+
+        # Debug field holds the counters and the stage times of the request
+        if (debug):
+            return result.return_in_json(dict(metadata or {}, debug=metrics.as_dict())), None
+
+        return result_in_json, compressed
+
+    def stream_search(search, progress):
+
+        # Improved results are sent while the search runs, the search process ends them with None
+        last_record = None
+
+        while True:
+            try:
+                record = progress.get(timeout=max(0, deadline + 1 - time.time()))
+            except queue.Empty:
+                break
+
+            if (record is None):
+                break
+
+            last_record = record
+            yield record
+
+        try:
+            # The search stops by itself at the deadline, the second of slack covers the run in progress
+            result, completed_runs, converged, beam_levels, search_metrics = search.result(timeout=max(0, deadline + 1 - time.time()))
+        except TimeoutError:
+            search.cancel()
+            result_in_json = None
+        else:
+            if (metrics is not None):
+                metrics.merge(search_metrics)
+
+            search_json = finish_search(result, completed_runs, converged, beam_levels)
+            result_in_json = None if search_json is None else search_json[0]
+
+        # The final record is the json of /api/find-path. If the search didn't finish in time the best
+        # route already sent is repeated as a partial result, it is busy only if nothing was sent
+        if (result_in_json is None and last_record is not None):
+            best = json.loads(last_record)
+            del best['progress']
+            best['partial'] = True
+
+            if (metrics is not None):
+                metrics.count('partial_responses')
+                finish_metrics(metrics)
+
+            yield json.dumps(best)
+        elif (result_in_json is None):
+            if (metrics is not None):
+                metrics.count('busy_responses')
+                finish_metrics(metrics)
+
+            yield busy_json()
+        else:
+            yield result_in_json
+
+    # find path, the population is evaluated by the search workers if there is more than one of them,
+    # otherwise the whole search is a single job and the cheapest queued searches run first. The beam
+    # search and the streamed searches are always a single job
+    if (search_workers > 1 and solver == 'genetic' and not stream):
+
+        # create graph object, the home node only lives in the snapshot overlay so the database isn't opened
+        graph = Graph(None, maximum_distance=maximum_distance, weight=0.504597714410906, snapshot=load_snapshot(database_directory), metrics=metrics)
+
+        arguments = (number_of_runs, latitude, longitude, get_search_executor(), search_workers)
+        options = {'population_size' : search_workers * 4, 'seed' : seed, 'deadline' : deadline}
+
+        if (profile_path is not None):
+            profiler = cProfile.Profile()
+            result = profiler.runcall(graph.parallel_genetic_near_neighbour, *arguments, **options)
+            profiler.dump_stats(profile_path)
+        else:
+            result = graph.parallel_genetic_near_neighbour(*arguments, **options)
+
+        completed_runs = graph.completed_runs
+        converged = graph.converged
+        beam_levels = None
+    else:
+
+        # Streamed searches put their improved results into a queue of the progress manager
+        progress = get_progress_manager().Queue() if (stream) else None
+
+        try:
+            search = get_search_executor().submit(search_path, database_directory, maximum_distance, latitude, longitude, number_of_runs, seed, deadline,
+                    None if metrics is None else Metrics(), profile_path, solver, progress, cost=deadline - start if number_of_runs is None else number_of_runs)
+        except SearchQueueFull:
+            return busy_response(metrics)
+
+        if (stream):
+            return stream_response(stream_search(search, progress), events)
+
+        try:
+            # The search stops by itself at the deadline, the second of slack covers the run in progress
+            result, completed_runs, converged, beam_levels, search_metrics = search.result(timeout=deadline + 1 - time.time())
+        except TimeoutError:
+            search.cancel()
+            return busy_response(metrics)
+
+        # Counters and stages of the worker process
+        if (metrics is not None):
+            metrics.merge(search_metrics)
+
+    search_json = finish_search(result, completed_runs, converged, beam_levels)
+
+    # Nothing was searched before the deadline
+    if (search_json is None):
+        return busy_response(metrics)
 
     # return result in json
-    return result.return_in_json()
+    return send_json(*search_json)
+
+# Start points of a batch and how many of them one search job handles
+maximum_batch_size = int(os.environ.get('MAXIMUM_BATCH_SIZE', 1000))
+batch_chunk_size = int(os.environ.get('BATCH_CHUNK_SIZE', 16))
+
+def read_points(text):
+
+    # Points are a json array or one json object per line, invalid points are kept as None
+    if (text.lstrip().startswith('[')):
+        values = json.loads(text)
+    else:
+        values = [json.loads(line) for line in text.splitlines() if line.strip() != '']
+
+    points = []
+
+    for value in values:
+        try:
+            latitude = float(value['lat'])
+            longitude = float(value['long'])
+
+            # Check if latitude and longitude are numbers in range
+            if (not math.isfinite(latitude) or not math.isfinite(longitude)):
+                raise ValueError
+
+            if (latitude < -90 or latitude > 90 or longitude < -180 or longitude > 180):
+                raise ValueError
+
+            points.append((latitude, longitude))
+        except (ValueError, TypeError, KeyError):
+            points.append(None)
+
+    return points
+
+def batch_line(index, result_in_json):
+    return '{"index": ' + str(index) + ', "result": ' + result_in_json + '}\n'
+
+def read_batch_line(line):
+
+    # Index and the result json of a line written by batch_line
+    prefix, result_in_json = line.rstrip('\n').split(', "result": ', 1)
+
+    return int(prefix[len('{"index": '):]), result_in_json[:-1]
+
+@route('/api/find-paths/<number_of_runs>', method='POST')
+def generate_paths(number_of_runs):
+
+    # Validate user input
+    try:
+        number_of_runs = int(number_of_runs)
+
+        # Check if number_of_runs is range
+        if (number_of_runs < 0 or number_of_runs > maximum_runs):
+            raise ValueError
+
+        # Optional seed makes the results reproducible, every point uses the same seed as /api/find-path
+        seed = request.query.get('seed')
+
+        if (seed is not None):
+            seed = int(seed)
+
+        points = read_points(request.body.read().decode('utf8'))
+
+        if (len(points) > maximum_batch_size):
+            raise ValueError
+
+    except ValueError:
+        temp_result = SearchResults()
+        temp_result.reset()
+        return temp_result.return_in_json()
+
+    empty_result = SearchResults()
+    empty_result.reset()
+
+    busy_result = empty_result.return_in_json({'busy' : True})
+
+    # Invalid and cached points are answered right away, the rest are searched in chunks of the same shard
+    # and the points of the shards of other backends are forwarded to them
+    lines = []
+    searched = {}
+    forwarded = {}
+
+    for index, point in enumerate(points):
+
+        if (point is None):
+            lines.append(batch_line(index, empty_result.return_in_json()))
+            continue
+
+        database_directory = 'beer.db'
+
+        if (sharded):
+            shard = shard_map.shard_for(*point)
+
+            # No brewery is in reach of the start point
+            if (shard is None):
+                lines.append(batch_line(index, empty_result.return_in_json()))
+                continue
+
+            if (shard not in local_shards):
+                forwarded.setdefault(shard, []).append((index, point))
+                continue
+
+            database_directory = shard_database_directory('beer.db', shard)
+
+        if (result_cache_size > 0):
+            cached_result = get_result_cache().get(get_result_cache().key(point[0], point[1], number_of_runs, seed, None, 'genetic', maximum_range))
+
+            if (cached_result is not None):
+                lines.append(batch_line(index, cached_result))
+                continue
+
+        searched.setdefault(database_directory, []).append((index, point))
+
+    chunks = [(database_directory, shard_points[start:start + batch_chunk_size]) for database_directory, shard_points in searched.items()
+            for start in range(0, len(shard_points), batch_chunk_size)]
+    chunks.reverse()
+
+    # Every other backend gets its points in one request, they are waited for with the chunks
+    forwarding = {}
+
+    if (len(forwarded) > 0):
+        forwarder = ThreadPoolExecutor(max_workers=len(forwarded))
+
+        for shard, shard_points in forwarded.items():
+            forwarding[forwarder.submit(forward_points, shard, [point for index, point in shard_points], number_of_runs, seed)] = shard_points
+
+        forwarder.shutdown(wait=False)
+
+    # Chunks of the batch being searched and their deadlines
+    in_flight = {}
+
+    def submit_chunks():
+
+        # At most one chunk per search worker is queued, so single requests can still get in between
+        while (len(chunks) > 0 and len(in_flight) < search_workers):
+            database_directory, chunk = chunks[-1]
+
+            try:
+                deadline = time.time() + search_deadline
+                future = get_search_executor().submit(search_paths, database_directory, maximum_range, [point for index, point in chunk],
+                        number_of_runs, seed, deadline, cost=number_of_runs * len(chunk))
+            except SearchQueueFull:
+                return
+
+            in_flight[future] = (chunks.pop()[1], deadline)
+
+    submit_chunks()
+
+    # Nothing of the batch fits into the queue
+    if (len(chunks) > 0 and len(in_flight) == 0 and len(forwarding) == 0):
+        return busy_response()
+
+    def chunk_lines(chunk, results):
+
+        for (index, (latitude, longitude)), (result, completed_runs, converged) in zip(chunk, results):
+
+            # Nothing was searched before the deadline
+            if (completed_runs == 0 and number_of_runs != 0):
+                yield batch_line(index, busy_result)
+
+            # Partial results aren't cached, a later request can do better, a search that converged is complete
+            elif (completed_runs < number_of_runs and not converged):
+                yield batch_line(index, result.return_in_json({'partial' : True, 'completed_runs' : completed_runs}))
+
+            else:
+                result_in_json = result.return_in_json()
+
+                if (result_cache_size > 0):
+                    get_result_cache().put(get_result_cache().key(latitude, longitude, number_of_runs, seed, None, 'genetic', maximum_range),
+                            result_in_json, compress_json(result_in_json))
+
+                yield batch_line(index, result_in_json)
+
+    def stream():
+
+        yield from lines
+
+        # Results are sent as the chunks and the forwarded points finish, the index tells which point they belong to
+        while (len(in_flight) > 0 or len(forwarding) > 0):
+
+            # The search stops by itself at the deadline, the second of slack covers the run in progress.
+            # Forwarded points are bounded by the timeout of their request
+            timeout = None
+
+            if (len(in_flight) > 0):
+                first_deadline = min(deadline for chunk, deadline in in_flight.values())
+                timeout = max(0, first_deadline + 1 - time.time())
+
+            done, not_done = wait(list(in_flight) + list(forwarding), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            # The chunk with the first deadline didn't finish in time, its points get busy results
+            if (len(done) == 0):
+                late = min(in_flight, key=lambda future: in_flight[future][1])
+                late.cancel()
+
+                for index, point in in_flight.pop(late)[0]:
+                    yield batch_line(index, busy_result)
+
+            for future in done:
+                if (future in forwarding):
+
+                    # Points the backend didn't answer get busy results
+                    for (index, point), result_in_json in zip(forwarding.pop(future), future.result()):
+                        yield batch_line(index, busy_result if result_in_json is None else result_in_json)
+                else:
+                    yield from chunk_lines(in_flight.pop(future)[0], future.result())
+
+            submit_chunks()
+
+            # The rest of the batch doesn't fit into the queue
+            if (len(in_flight) == 0):
+                for database_directory, chunk in reversed(chunks):
+                    for index, point in chunk:
+                        yield batch_line(index, busy_result)
+
+                chunks.clear()
+
+    response.content_type = 'application/x-ndjson'
+
+    return send_lines(stream())
+
+@route('/api/metrics')
+def metrics_in_text():
+
+    # Prometheus text format
+    response.content_type = 'text/plain; version=0.0.4'
+
+    with metrics_lock:
+        return total_metrics.prometheus() + '\n'
+
+@route('/api/cache-stats')
+def cache_stats():
+    return get_result_cache().stats_in_json()
 
 if __name__ == '__main__':
 	run(host='localhost', port=5000, debug=False)
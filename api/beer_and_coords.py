@@ -1,12 +1,13 @@
-import copy
-
 # Class used to store aditional information for the brewery such as its coordinates and the beer name
 class BeerAndCoords:
 
+    # Attributes are kept in slots instead of a dictionary per object
+    __slots__ = ('beer', 'latitude', 'longitude')
+
     def __init__(self, beer=[], latitude="", longitude=""):
 
-        # Creates the deep copy of the beer array
-        self.beer = copy.deepcopy(beer)
+        # Creates a copy of the beer array, beer names are strings so they don't have to be copied
+        self.beer = list(beer)
 
         self.latitude = latitude
         self.longitude = longitude
@@ -14,3 +15,34 @@ class BeerAndCoords:
     def set_coords(self, latitude, longitude):
         self.latitude = latitude
         self.longitude = longitude
+
+    def attributes(self):
+
+        """
+        Returns the attributes hashed by their names, it stands in for vars() which doesn't work with slots
+
+        >>> BeerAndCoords(['a'], 51, 14).attributes()
+        {'beer': ['a'], 'latitude': 51, 'longitude': 14}
+        """
+
+        return {name : getattr(self, name) for cls in reversed(type(self).__mro__) for name in getattr(cls, '__slots__', ())}
+
+    def __getstate__(self):
+        return self.attributes()
+
+    def __setstate__(self, state):
+
+        """
+        Restores the pickled attributes, objects pickled before the slots were added have the same dictionary
+
+        >>> import pickle
+        >>> pickle.loads(pickle.dumps(BeerAndCoords(['a'], 51, 14))).attributes()
+        {'beer': ['a'], 'latitude': 51, 'longitude': 14}
+        """
+
+        for name, value in state.items():
+            setattr(self, name, value)
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,238 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from brewery import Brewery
+from graph import Graph
+
+"""
+Benchmarks the stages of the path finding pipeline on the bundled data and
+on synthetic datasets, the report is json so runs can be compared
+
+    python benchmark.py --sizes 10000,100000 --output after.json --compare before.json
+"""
+
+# Stages measured for every dataset in the order they run
+STAGES = ['generate_graph', 'generate_snapshot', 'insert_home', 'nearest_neighbour', 'genetic_near_neighbour', 'return_in_json']
+
+def bundled_nodes():
+
+    """
+    Returns the breweries of the bundled csv files
+    """
+
+    graph = Graph(None)
+    graph.reset()
+    graph.generate_nodes()
+
+    return graph.nodes
+
+def synthetic_nodes(size, template, seed):
+
+    """
+    Generates breweries around the coordinates of the template breweries, so the density
+    grows with the size like the real data would, beers are drawn from the template beers
+
+    >>> nodes = synthetic_nodes(3, [Brewery('a', '1', ['x', 'y'], 51, 14)], 1)
+    >>> [node.brewery_id for node in nodes], all(50 <= node.latitude <= 52 for node in nodes)
+    (['1', '2', '3'], True)
+    """
+
+    generator = random.Random(seed)
+    beers = [beer for node in template for beer in node.beer] or ['beer']
+
+    nodes = []
+
+    for index in range(size):
+
+        origin = generator.choice(template)
+
+        latitude = max(-90, min(90, origin.latitude + generator.uniform(-1, 1)))
+        longitude = (origin.longitude + generator.uniform(-1, 1) + 180) % 360 - 180
+
+        nodes.append(Brewery('Synthetic ' + str(index + 1), str(index + 1),
+                generator.sample(beers, min(len(beers), generator.randint(0, 10))), latitude, longitude))
+
+    return nodes
+
+def measure(function, calls=1):
+
+    """
+    Runs the function and returns its result with the wall time and the allocations it made,
+    the time is measured without tracing and the allocations in a second traced run
+    """
+
+    start = time.perf_counter()
+
+    for call in range(calls):
+        result = function(call)
+
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+
+    before = tracemalloc.take_snapshot()
+    function(0)
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+
+    tracemalloc.stop()
+
+    statistics = after.compare_to(before, 'filename')
+
+    return result, {
+        'calls' : calls,
+        'seconds_total' : seconds,
+        'seconds_per_call' : seconds / calls,
+        'allocated_bytes' : sum(max(0, statistic.size_diff) for statistic in statistics),
+        'allocations' : sum(max(0, statistic.count_diff) for statistic in statistics),
+        'peak_bytes' : peak
+    }
+
+def benchmark_dataset(name, nodes, number_of_points, number_of_runs, seed):
+
+    """
+    Runs every stage on the dataset and reports times, allocations and the quality of the routes
+    """
+
+    report = {'name' : name, 'breweries' : len(nodes), 'stages' : {}}
+
+    graph = Graph(None)
+
+    def generate_graph(call):
+        graph.reset()
+        graph.nodes = nodes
+        graph.generate_graph()
+
+    _, report['stages']['generate_graph'] = measure(generate_graph)
+
+    snapshot, report['stages']['generate_snapshot'] = measure(lambda call: graph.generate_snapshot())
+
+    report['edges'] = len(snapshot.neighbours)
+
+    # Start points are close to random breweries
+    generator = random.Random(seed)
+    points = []
+
+    for point in range(number_of_points):
+        node = generator.choice(nodes)
+        points.append((node.latitude + generator.uniform(-0.5, 0.5), node.longitude + generator.uniform(-0.5, 0.5)))
+
+    search = Graph(None, weight=0.504597714410906, snapshot=snapshot)
+
+    _, report['stages']['insert_home'] = measure(lambda call: search.insert_home(*points[call]), number_of_points)
+
+    def nearest_neighbour(call):
+        search.insert_home(*points[call])
+        result = search.find_path_from_home()
+        search.remove_home()
+        return result
+
+    nearest_results = [nearest_neighbour(call) for call in range(number_of_points)]
+    _, report['stages']['nearest_neighbour'] = measure(nearest_neighbour, number_of_points)
+
+    genetic_results = []
+
+    def genetic_near_neighbour(call):
+        result = search.genetic_near_neighbour(number_of_runs, *points[call], seed=seed + call)
+        genetic_results.append(result)
+        return result
+
+    _, report['stages']['genetic_near_neighbour'] = measure(genetic_near_neighbour, number_of_points)
+
+    _, report['stages']['return_in_json'] = measure(lambda call: genetic_results[call].return_in_json(), number_of_points)
+
+    report['quality'] = {
+        'nearest_neighbour' : route_quality(nearest_results),
+        'genetic_near_neighbour' : route_quality(genetic_results[:number_of_points])
+    }
+
+    return report
+
+def route_quality(results):
+
+    """
+    Returns the mean number of beers collected and kilometres flown
+
+    >>> route_quality([SearchResults([], {'a', 'b'}, [0, 10, 20.5]), SearchResults([], set(), [0])])
+    {'beers': 1.0, 'kilometres': 15.25}
+    """
+
+    return {
+        'beers' : sum(len(result.beer) for result in results) / max(1, len(results)),
+        'kilometres' : sum(sum(result.distance) for result in results) / max(1, len(results))
+    }
+
+def compare(report, baseline):
+
+    """
+    Prints how much slower or faster each stage got compared to the baseline report
+    """
+
+    baseline_datasets = {dataset['name'] : dataset for dataset in baseline['datasets']}
+
+    for dataset in report['datasets']:
+
+        if (dataset['name'] not in baseline_datasets):
+            continue
+
+        old = baseline_datasets[dataset['name']]
+
+        for stage in STAGES:
+            ratio = dataset['stages'][stage]['seconds_per_call'] / max(1e-12, old['stages'][stage]['seconds_per_call'])
+            print(dataset['name'] + ' ' + stage + ': ' + str(round(ratio, 3)) + 'x time', file=sys.stderr)
+
+        for algorithm in dataset['quality']:
+            print(dataset['name'] + ' ' + algorithm + ' beers: ' + str(old['quality'][algorithm]['beers']) + ' -> ' +
+                    str(dataset['quality'][algorithm]['beers']), file=sys.stderr)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmarks the path finding pipeline')
+    parser.add_argument('--sizes', default='10000,100000', help='comma separated sizes of the synthetic datasets, empty for none')
+    parser.add_argument('--points', type=int, default=10, help='number of start points per dataset')
+    parser.add_argument('--runs', type=int, default=20, help='number of genetic runs per start point')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='file to write the json report to, standard output by default')
+    parser.add_argument('--compare', help='json report of a previous run to compare with')
+    parser.add_argument('--doctest', action='store_true', help='runs the doctests instead')
+    arguments = parser.parse_args()
+
+    if (arguments.doctest):
+        import doctest
+        from search_results import SearchResults
+        doctest.testmod()
+        sys.exit()
+
+    template = bundled_nodes()
+
+    datasets = [('bundled', template)]
+
+    for size in [int(size) for size in arguments.sizes.split(',') if size != '']:
+        datasets.append(('synthetic_' + str(size), synthetic_nodes(size, template, arguments.seed)))
+
+    report = {
+        'python' : platform.python_version(),
+        'machine' : platform.machine(),
+        'points' : arguments.points,
+        'runs' : arguments.runs,
+        'seed' : arguments.seed,
+        'datasets' : []
+    }
+
+    for name, nodes in datasets:
+        report['datasets'].append(benchmark_dataset(name, nodes, arguments.points, arguments.runs, arguments.seed))
+
+    if (arguments.output):
+        with open(arguments.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if (arguments.compare):
+        with open(arguments.compare) as baseline:
+            compare(report, json.load(baseline))
@@ -5,6 +5,18 @@ because it is going to be handled by the the database
 """
 class Connection:
 
+    # One object is created per edge, slots keep them small
+    __slots__ = ('brewery_id', 'length')
+
     def __init__(self, brewery_id, length):
         self.brewery_id = brewery_id
-        self.length = length
\ No newline at end of file
+        self.length = length
+
+    def __getstate__(self):
+        return {'brewery_id' : self.brewery_id, 'length' : self.length}
+
+    def __setstate__(self, state):
+
+        # Connections pickled before the slots were added have the same dictionary
+        for name, value in state.items():
+            setattr(self, name, value)
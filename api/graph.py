@@ -1,21 +1,52 @@
+import cProfile
 import math
+import os
 import sys
+import bisect
 import copy
-import csv
+import heapq
 import random
+import time
+from array import array
+from concurrent.futures import TimeoutError
 
+import numpy
 from graphdb import GraphDB
 
 from connection import Connection
 from brewery import Brewery
 from beer_and_coords import BeerAndCoords
-from search_results import SearchResults
+from search_results import SearchResults, brewery_in_json
+from metrics import Metrics
+from haversine import distances_from
+from spatial_index import SpatialIndex
+from search_executor import SearchQueueFull
+from ingest import stream_breweries
+from graph_snapshot import GraphSnapshot, load_snapshot, sort_candidates, graph_file_path, distance_file_path, popcount
+from shard_map import ShardMap, rebuild_shards
 
 # Stores the brewery graph
 class Graph:
 
-    def __init__(self, database_directory, nodes=[], connections={}, precalculated_distance={}, maximum_distance=1000, home_id="", weight=10):
-        self.database = GraphDB(database_directory, autocommit=False)
+    def __init__(self, database_directory, nodes=[], connections={}, precalculated_distance={}, maximum_distance=1000, home_id="", weight=10, snapshot=None, local_search=True, metrics=None):
+        self.snapshot = snapshot
+        self.local_search = local_search
+
+        # Counters and stage timers are only recorded if the graph has metrics
+        self.metrics = metrics
+        self.home_node = None
+        self.home_neighbours = array('l')
+        self.home_lengths = array('d')
+        self.home_beer_counts = array('l')
+        self.home_remaining_beer_counts = array('l')
+        self.home_distances = {}
+        self.candidates = {}
+
+        # Graph searched on a snapshot doesn't need the database
+        if (database_directory is not None):
+            self.database = GraphDB(database_directory, autocommit=False)
+        else:
+            self.database = None
         self.nodes = nodes
         self.connections = connections
         self.precalculated_distance = precalculated_distance
@@ -23,6 +54,9 @@ class Graph:
         self.home_id = home_id
         self.weight = weight
 
+        # Set by the genetic algorithm when more runs wouldn't find new routes
+        self.converged = False
+
     def reset(self):
 
         """
@@ -36,6 +70,7 @@ class Graph:
 
         self.nodes = []
         self.connections = {}
+        self.candidates = {}
         self.precalculated_distance = {}
         self.maximum_distance = 1000
 
@@ -72,59 +107,10 @@ class Graph:
 
     def generate_nodes(self):
         """
-        Parses input files and generates nodes for the graph
+        Parses input files and generates nodes for the graph, the files are streamed row by row
         """
 
-        beer_and_coords = {}
-        breweries = []
-
-        # Read geocodes.csv file
-        with open('./data/geocodes.csv', encoding='utf8') as coord_data:
-            csv_reader = csv.reader(coord_data, delimiter=',')
-            for row in csv_reader:
-
-                #Check if no data is missing 
-                if (len(row) >= 4):
-
-                    # Create new BeerAndCoords object and hash it using brewery id as the key
-                    beer_and_coords[row[1]] = BeerAndCoords(latitude=row[2], longitude=row[3])
-
-        # Read beers.csv file
-        with open('./data/beers.csv', encoding='utf8') as beer_data:
-            csv_reader = csv.reader(beer_data, delimiter=',')
-            for row in csv_reader:
-
-                # Check if no data is missing
-                if (len(row) >= 3):
-
-                    # Check if the beer is in the beer_and_coords array
-                    if row[1] in beer_and_coords:
-
-                        # Append the beer to the beer_and_coords' beer array by the brewery id
-                        beer_and_coords[row[1]].beer.append(row[2])
-
-        # Read breweries.csv file
-        with open('./data/breweries.csv', encoding='utf8') as brewery_data:
-            csv_reader = csv.reader(brewery_data, delimiter=',')
-            for row in csv_reader:
-
-                """
-                Check if no data is missing
-                Check BeerAndCoords object is hashed in the beer_and_coords dictionary by brewery id
-                Check if latitude is set
-                """
-                if (len(row) >= 2 and row[0] in beer_and_coords and beer_and_coords[row[0]].latitude != ""):
-
-                    # Retrieve BeerAndCoords object by brewery id
-                    temp_beer_and_coords = beer_and_coords[row[0]]
-
-                    # Initialise temporary Brewery object
-                    temp_brewery = Brewery(row[1], row[0], temp_beer_and_coords.beer, float(temp_beer_and_coords.latitude), float(temp_beer_and_coords.longitude))
-
-                    # Append to all breweries
-                    breweries.append(temp_brewery)
-
-        self.nodes = breweries
+        self.nodes = list(stream_breweries('./data'))
 
     def generate_graph(self):
         """
@@ -144,47 +130,42 @@ class Graph:
         1
         2
         """
-        # Loop through all nodes
-        for primary in range(len(self.nodes)):
-
-            # Array to store connection objects
-            connections = []
+        beer_counts = {node.brewery_id : len(node.beer) for node in self.nodes}
 
-            node = self.nodes[primary]
+        # Index the nodes so only the close ones are measured
+        spatial_index = SpatialIndex([node.latitude for node in self.nodes], [node.longitude for node in self.nodes])
 
-            # Loop through all nodes
-            for secondary in range(len(self.nodes)):
+        # Loop through all nodes
+        for primary in range(len(self.nodes)):
+            self.generate_connections(primary, spatial_index, beer_counts)
 
-                # Make sure that node doesn't connect to itself
-                if (primary == secondary):
-                    continue
+    def generate_connections(self, primary, spatial_index, beer_counts):
 
-                temp_node = self.nodes[secondary]
+        """
+        Generates the connections and the candidate list of a single node
+        """
 
-                # Check if distance was already calculated
-                key = int(node.brewery_id)
-                key_temp = int(temp_node.brewery_id)
+        # Array to store connection objects
+        connections = []
 
-                final_key = str(min(key, key_temp))+'|'+str(max(key, key_temp))
+        node = self.nodes[primary]
 
-                if (final_key in self.precalculated_distance):
-                    distance = self.precalculated_distance[final_key]
+        # Find the nodes that are within the maximum distance
+        indexes, distances = spatial_index.within(node.latitude, node.longitude, self.maximum_distance)
 
-                else:
+        for secondary, distance in zip(indexes.tolist(), distances.tolist()):
 
-                    # Calculate distance between two nodes
-                    distance = self.calculate_distance(node.latitude, node.longitude,
-                            temp_node.latitude, temp_node.longitude)
+            # Make sure that node doesn't connect to itself
+            if (primary == secondary):
+                continue
 
-                    # Store the value
-                    self.precalculated_distance[final_key] = distance
+            connections.append(Connection(self.nodes[secondary].brewery_id, distance))
 
-                # If distance is equal or less to the maximum distance, store the connection
-                if (distance <= self.maximum_distance):
-                    connections.append(Connection(temp_node.brewery_id, distance))
+        # Hash connections using brewery id as a key
+        self.connections[node.brewery_id] = connections
 
-            # Hash connections using brewery id as a key
-            self.connections[node.brewery_id] = connections
+        # Candidate lists sorted by distance for the snapshot search
+        self.candidates[node.brewery_id] = sort_candidates(connections, beer_counts)
 
     def store_graph(self):
         """
@@ -211,6 +192,8 @@ class Graph:
         3
         1
         2
+        >>> graph.database('3').candidates(list)[0]
+        (['2', '1'], array('d', [755.621, 973.8]), array('l', [0, 0]))
         >>> graph.database._destroy()
         """
 
@@ -226,12 +209,40 @@ class Graph:
 
             # Map brewery id to list of Connection objects
             self.database.store_relation(node.brewery_id, 'connects', self.connections[node.brewery_id])
+
+            # Map brewery id to the candidate list sorted by distance
+            self.database.store_relation(node.brewery_id, 'candidates', self.candidates[node.brewery_id])
         
         # Store of brewery ids for easier traversal of the graph
         self.database.store_relation('db', 'contains', brewery_ids)
 
         self.database.commit()
 
+    def generate_snapshot(self):
+
+        """
+        Creates the snapshot of the generated graph
+
+        >>> graph = Graph(None)
+        >>> graph.reset()
+        >>> graph.nodes = [Brewery(brewery_id='1', latitude=34, longitude=2),
+        ...     Brewery(brewery_id='2', latitude=34, longitude=14),
+        ...     Brewery(brewery_id='3', latitude=40, longitude=10)]
+        >>> graph.generate_graph()
+        >>> snapshot = graph.generate_snapshot()
+        >>> snapshot.brewery_ids, list(snapshot.offsets), list(snapshot.neighbours)
+        (['1', '2', '3'], [0, 1, 2, 4], [2, 2, 1, 0])
+        """
+
+        snapshot = GraphSnapshot()
+
+        for node in self.nodes:
+            snapshot.add_node(node, self.candidates[node.brewery_id])
+
+        snapshot.resolve()
+
+        return snapshot
+
     def generate_and_store_graph(self):
 
         # Reads .csv files containing information and generates nodes
@@ -243,43 +254,199 @@ class Graph:
         # Stores generated graph into the database
         self.store_graph()
 
+    def update_graph(self):
+        """
+        Applies the changes of the nodes to the stored graph, only the connections of the added and
+        changed nodes and of the nodes that have or had them as neighbours are recomputed and replaced
+        Returns the brewery ids of the recomputed nodes
+
+        >>> graph = Graph('test.db')
+        >>> graph.reset()
+        >>> graph.nodes = [Brewery(brewery_id='1', latitude=34, longitude=2),
+        ...     Brewery(brewery_id='2', latitude=34, longitude=14),
+        ...     Brewery(brewery_id='3', latitude=40, longitude=10),
+        ...     Brewery(brewery_id='4', latitude=-33, longitude=151)]
+        >>> graph.generate_graph()
+        >>> graph.store_graph()
+        >>> graph.reset()
+        >>> graph.nodes = [Brewery(brewery_id='1', beer=['a'], latitude=34, longitude=2),
+        ...     Brewery(brewery_id='3', latitude=40, longitude=10),
+        ...     Brewery(brewery_id='4', latitude=-33, longitude=151),
+        ...     Brewery(brewery_id='5', latitude=-34, longitude=151)]
+        >>> graph.update_graph()
+        ['1', '3', '4', '5']
+        >>> graph.database('db').contains(list)[0]
+        ['1', '3', '4', '5']
+        >>> graph.database('3').candidates(list)[0]
+        (['1'], array('d', [973.8]), array('l', [1]))
+        >>> graph.database('1').is_node(list)[0].beer, graph.database('2').is_node(list)
+        (['a'], [])
+        >>> graph.update_graph()
+        []
+        >>> graph.database._destroy()
+        """
+
+        # graphdb indexes the relations by their source only, looking up what relates to an old object needs them by target too
+        self.database.conn.execute('CREATE INDEX IF NOT EXISTS relations_dst ON relations (dst)')
+
+        stored_ids = self.database('db').contains(list)
+
+        if (len(stored_ids) == 0):
+            stored_ids = []
+        else:
+            stored_ids = stored_ids[0]
+
+        stored_nodes = {brewery_id : self.database(brewery_id).is_node(list)[0] for brewery_id in stored_ids}
+        brewery_ids = [node.brewery_id for node in self.nodes]
+
+        # Nodes that were added or whose name, beers or coordinates changed and nodes that were removed
+        changed = [node for node in self.nodes if (node.brewery_id not in stored_nodes or node.attributes() != stored_nodes[node.brewery_id].attributes())]
+        removed = [stored_nodes[brewery_id] for brewery_id in set(stored_ids) - set(brewery_ids)]
+        moved = [stored_nodes[node.brewery_id] for node in changed if node.brewery_id in stored_nodes]
+
+        beer_counts = {node.brewery_id : len(node.beer) for node in self.nodes}
+
+        # Index the nodes so only the close ones are measured
+        spatial_index = SpatialIndex([node.latitude for node in self.nodes], [node.longitude for node in self.nodes])
+
+        changed_ids = set(node.brewery_id for node in changed)
+        affected = set(changed_ids)
+
+        # Nodes around the new and the old position of a changed node have it as a neighbour,
+        # the radius is padded so a distance rounded the other way can't miss one of them
+        for node in changed + moved + removed:
+            indexes, distances = spatial_index.within(node.latitude, node.longitude, self.maximum_distance + 1)
+            affected.update(brewery_ids[index] for index in indexes.tolist())
+
+        updated = []
+
+        for primary in range(len(self.nodes)):
+
+            node = self.nodes[primary]
+
+            if (node.brewery_id not in affected):
+                continue
+
+            self.generate_connections(primary, spatial_index, beer_counts)
+
+            # Unchanged nodes keep their stored Brewery object
+            if (node.brewery_id in changed_ids):
+                self.replace_relation(node.brewery_id, 'is_node', node)
+
+            self.replace_relation(node.brewery_id, 'connects', self.connections[node.brewery_id])
+            self.replace_relation(node.brewery_id, 'candidates', self.candidates[node.brewery_id])
+
+            updated.append(node.brewery_id)
+
+        for node in removed:
+            for relation in ['is_node', 'connects', 'candidates']:
+                self.replace_relation(node.brewery_id, relation, None)
+
+        if (brewery_ids != stored_ids):
+            self.replace_relation('db', 'contains', brewery_ids)
+
+        self.database.commit()
+
+        return updated
+
+    def replace_relation(self, source, relation, value):
+
+        """
+        Replaces what the source is related to by the value, None removes the source with its relations
+
+        >>> graph = Graph('test.db')
+        >>> graph.database.store_relation('1', 'connects', [])
+        >>> graph.database.store_relation('2', 'connects', [])
+        >>> graph.replace_relation('1', 'connects', ['3'])
+        >>> graph.database('1').connects(list), graph.database('2').connects(list)
+        ([['3']], [[]])
+        >>> graph.replace_relation('2', 'connects', None)
+        >>> [] in graph.database, '2' in graph.database, '1' in graph.database
+        (False, False, True)
+        >>> graph.database._destroy()
+        """
+
+        old_values = list(self.database.find(source, relation))
+
+        self.database.delete_relation(source, relation)
+
+        # Source without relations left is deleted as well
+        if (value is None):
+            old_values.append(source)
+
+        # Equal objects are stored once, so an old object is only deleted when nothing else relates to it
+        for old_value in old_values:
+            if (len(list(self.database.relations_of(old_value))) == 0 and len(list(self.database.relations_to(old_value))) == 0):
+                self.database.delete_item(old_value)
+
+        if (value is not None):
+            self.database.store_relation(source, relation, value)
+
+    def generate_and_update_graph(self):
+
+        # Reads .csv files containing information and generates nodes
+        self.generate_nodes()
+
+        # Recomputes the parts of the stored graph that changed
+        return self.update_graph()
+
     def insert_home(self, latitude, longitude):
 
         """
-        Create home node and insert it into the database
+        Create home node and insert it into the database, when the graph has a snapshot
+        the home node only lives in memory for the duration of the request
         >>> graph = Graph('test.db', home_id='home')
         >>> graph.reset()
         >>> graph.insert_home(51, 53)
         >>> graph.database(graph.home_id).is_node(list)[0].latitude
         51
         >>> graph.database._destroy()
+
+        >>> graph = Graph(None, snapshot=GraphSnapshot())
+        >>> graph.snapshot.add_node(Brewery(brewery_id='1', latitude=34, longitude=2))
+        >>> graph.snapshot.add_node(Brewery(brewery_id='2', latitude=60, longitude=2))
+        >>> graph.snapshot.resolve()
+        >>> graph.insert_home(35, 2)
+        >>> graph.home_node.latitude, list(graph.home_neighbours), list(graph.home_lengths)
+        (35, [0], [111.195])
         """
 
         # Creates Brewery object for home
         node_to_insert = Brewery(latitude=latitude, longitude=longitude, brewery_id="home")
 
-        # stores connections
-        connections = []
+        # Keep the home node in memory for the snapshot search
+        self.home_node = node_to_insert
+
+        # With a snapshot the home connections are a request local overlay and aren't stored
+        if (self.snapshot is not None):
+
+            # Find the nodes that are within the maximum distance, their distances are reused during the search
+            indexes, distances = self.snapshot.spatial_index.within(latitude, longitude, self.maximum_distance)
+
+            # Sort them into a candidate list like the ones of the snapshot nodes
+            order = numpy.argsort(distances, kind='stable')
+            beer_counts = numpy.asarray(self.snapshot.beer_counts)[indexes[order]]
+
+            self.home_neighbours = array('l', indexes[order].tolist())
+            self.home_lengths = array('d', distances[order].tolist())
+            self.home_beer_counts = array('l', beer_counts.tolist())
+            self.home_remaining_beer_counts = array('l', numpy.maximum.accumulate(beer_counts[::-1])[::-1].tolist())
+            self.home_distances = dict(zip(self.home_neighbours, self.home_lengths))
+            return
 
         nodes = self.database('db').contains(list)
 
         if (len(nodes) == 0):
             nodes = []
         else:
-            nodes = nodes[0]
-        
-        for brewery_id in nodes:
-            
-            node = self.database(brewery_id).is_node(list)[0]
-
-            # Calculate distance between two nodes
-            distance = self.calculate_distance(node.latitude, node.longitude,
-                    node_to_insert.latitude, node_to_insert.longitude)
- 
-            # If distance is equal or less to the maximum distance, store the connection
-            if (distance <= self.maximum_distance):
-                connections.append(Connection(node.brewery_id, distance))
-        
+            nodes = [self.database(brewery_id).is_node(list)[0] for brewery_id in nodes[0]]
+
+        # Calculate distances from all nodes to home at once
+        distances = distances_from(latitude, longitude, [node.latitude for node in nodes], [node.longitude for node in nodes])
+
+        # If distance is equal or less to the maximum distance, store the connection
+        connections = [Connection(node.brewery_id, distance) for node, distance in zip(nodes, distances.tolist()) if distance <= self.maximum_distance]
+
         self.database.store_relation(self.home_id, 'is_node', node_to_insert)
         self.database.store_relation(self.home_id, 'connects', connections)
 
@@ -298,6 +465,17 @@ class Graph:
         >>> graph.database._destroy()
         """
 
+        self.home_node = None
+
+        # Home node of the snapshot was never stored
+        if (self.snapshot is not None):
+            self.home_neighbours = array('l')
+            self.home_lengths = array('d')
+            self.home_beer_counts = array('l')
+            self.home_remaining_beer_counts = array('l')
+            self.home_distances = {}
+            return
+
         self.database.delete_item(self.home_id)
 
         self.database.commit()
@@ -312,6 +490,10 @@ class Graph:
         min_distance = self.maximum_distance+1
         min_neighbour = -1
 
+        if (self.metrics is not None):
+            self.metrics.count('database_fetches', len(neighbours))
+            self.metrics.count('neighbours_scanned', len(neighbours))
+
         for neighbour in neighbours:
 
             neighbour_node = self.database(neighbour.brewery_id).is_node(list)[0]
@@ -340,11 +522,41 @@ class Graph:
         >>> graph.database._destroy()
         """
 
-        # Retrieve home node from the database
-        home_node = self.database(self.home_id).is_node(list)[0]
+        # Retrieve home node from memory or from the database
+        if (self.home_node is not None):
+            home_node = self.home_node
+        else:
+            home_node = self.database(self.home_id).is_node(list)[0]
 
         return self.calculate_distance(node_to_check.latitude, node_to_check.longitude, home_node.latitude, home_node.longitude)
 
+    def distance_to_home(self, node):
+
+        """
+        Find the distance between the home node and the snapshot node, it is read from the home distance row
+        and only calculated for the nodes that are further than the maximum distance
+
+        >>> graph = Graph(None, snapshot=GraphSnapshot())
+        >>> graph.snapshot.add_node(Brewery(brewery_id='1', latitude=41, longitude=7))
+        >>> graph.snapshot.add_node(Brewery(brewery_id='2', latitude=51, longitude=15))
+        >>> graph.snapshot.resolve()
+        >>> graph.insert_home(51, 14)
+        >>> graph.home_distances
+        {1: 69.977}
+        >>> graph.distance_to_home(0), graph.distance_to_home(1), graph.distance_to_home(-1)
+        (1235.096, 69.977, 0.0)
+        """
+
+        # Home node has the index -1
+        if (node == -1):
+            return 0.0
+
+        if (node not in self.home_distances):
+            self.home_distances[node] = self.calculate_distance(self.snapshot.latitudes[node], self.snapshot.longitudes[node],
+                    self.home_node.latitude, self.home_node.longitude)
+
+        return self.home_distances[node]
+
     def find_max_result(self, results):
         """
         Find the maximum number of beers collected
@@ -423,10 +635,17 @@ class Graph:
         # Retrieve Brewery object from the database
         min_neighbour = self.database(min_neighbour.brewery_id).is_node(list)[0]
         
+        if (self.metrics is not None):
+            self.metrics.count('database_fetches', 2)
+            self.metrics.count('hops')
+
         if (distance + distance_neighbour + self.check_distance_to_home(min_neighbour) > self.maximum_distance * 2):
             results.append(copy.deepcopy(results[-1]))
             results[-2].distance.append(self.check_distance_to_home(results[-2].factories[-1]))
 
+            if (self.metrics is not None):
+                self.metrics.count('deep_copies')
+
         # Update distance
         distance += distance_neighbour
 
@@ -439,98 +658,1371 @@ class Graph:
         
         return result
     
-    def find_path(self, latitude, longitude):
+    def snapshot_row(self, node):
 
-        # Create home node and connect it with other nodes
-        self.insert_home(latitude, longitude)
+        """
+        Returns the arrays and the bounds of the candidate row of the home node (-1) or of a snapshot node.
+        Rows are sorted by length, so a maximum distance below the one the graph was built with only uses
+        the start of them
+
+        >>> graph = Graph(None, snapshot=GraphSnapshot(), maximum_distance=500)
+        >>> graph.snapshot.add_node(Brewery(brewery_id='1', latitude=34, longitude=2), (['2', '3'], [450.5, 800], [0, 0]))
+        >>> graph.snapshot.add_node(Brewery(brewery_id='2', latitude=34, longitude=6.9))
+        >>> graph.snapshot.add_node(Brewery(brewery_id='3', latitude=34, longitude=10.7))
+        >>> graph.snapshot.resolve()
+        >>> graph.snapshot_row(0)[4:]
+        (0, 1)
+        """
 
-        # Retrieve home node
-        home_node = self.database(self.home_id).is_node(list)[0]
+        if (node == -1):
+            return self.home_neighbours, self.home_lengths, self.home_beer_counts, self.home_remaining_beer_counts, 0, len(self.home_neighbours)
 
-        # Initilize the SearchResults object to store search results
-        result = SearchResults()
+        lengths = self.snapshot.lengths
 
-        # After the reinitilization the old value of the object is kept, so it is reset
-        result.reset()
+        # Lengths are rounded to metres and their float32 copies are accurate to well under half a metre
+        start = self.snapshot.offsets[node]
+        end = bisect.bisect_right(lengths, self.maximum_distance + 0.0005, start, self.snapshot.offsets[node + 1])
 
-        # Append home node to the begining of the results
-        result.factories.append(home_node)
-        
-        # Find path using nearest neighbour algorithm
-        result = self.nearest_neighbour(self.home_id, 0, [], [result])
+        return self.snapshot.neighbours, lengths, self.snapshot.candidate_beer_counts, self.snapshot.remaining_beer_counts, start, end
 
-        # Retrieve last brewery
-        last_node = result.factories[-1]
+    def find_min_snapshot_neighbour(self, node, visited, collected=0):
 
-        # Append home node to the back
-        result.factories.append(home_node)
+        """
+        Find the closest neighbour of a snapshot node that isn't flagged as visited, the home node has the index -1
+        The weight is applied to the beers of the neighbour that aren't in the collected beer mask yet
+        Candidates are sorted by distance, so the scan stops once even the highest beer count left in the row
+        can't make a candidate better than the best one found
+        Returns the index of the neighbour and the length of the connection
+
+        >>> graph = Graph(None, snapshot=GraphSnapshot(), weight=30)
+        >>> graph.snapshot.add_node(Brewery(brewery_id='1', beer=['a'], latitude=34, longitude=2))
+        >>> graph.snapshot.add_node(Brewery(brewery_id='2', beer=['b', 'c'], latitude=34, longitude=2.25))
+        >>> graph.snapshot.resolve()
+        >>> graph.insert_home(34, 1.9)
+        >>> list(graph.home_lengths)
+        [9.218, 32.265]
+        >>> graph.find_min_snapshot_neighbour(-1, bytearray([0, 0]))
+        (1, 32.265)
+        >>> graph.find_min_snapshot_neighbour(-1, bytearray([0, 1]))
+        (0, 9.218)
+        >>> graph.find_min_snapshot_neighbour(-1, bytearray([0, 0]), collected=graph.snapshot.beer_masks[1])
+        (0, 9.218)
+        >>> graph.weight = 0
+        >>> graph.find_min_snapshot_neighbour(-1, bytearray([0, 0]))
+        (0, 9.218)
+        """
 
-        # Remove home node and it's connections
-        self.remove_home()
+        neighbours, lengths, beer_counts, remaining_beer_counts, start, end = self.snapshot_row(node)
+
+        weight = self.weight
+        beer_masks = self.snapshot.beer_masks
+        distinct_beer_counts = self.snapshot.distinct_beer_counts
+
+        # With a negative weight beers only make a candidate worse, so the bound is the length itself
+        bound_weight = max(weight, 0)
+
+        min_distance = self.maximum_distance+1
+        min_neighbour = -1
+        min_length = 0
+
+        for position in range(start, end):
+
+            length = lengths[position]
+
+            # Stop if none of the remaining candidates can be better
+            if (length - remaining_beer_counts[position] * bound_weight >= min_distance):
+                end = position
+                break
+
+            neighbour = neighbours[position]
+
+            # The beer count of the neighbour bounds the number of new beers, so most candidates are skipped without counting
+            if (length - beer_counts[position] * bound_weight >= min_distance or visited[neighbour]):
+                continue
+
+            # Check if neighbour is closer than the previous ones and apply the weight to the beers that are new,
+            # mostly the beers don't overlap and counting the bits of zero is cheap
+            distance = length - (distinct_beer_counts[neighbour] - popcount(beer_masks[neighbour] & collected)) * weight
+
+            if (distance < min_distance):
+
+                # Store it
+                min_distance = distance
+                min_neighbour = neighbour
+                min_length = length
+
+        if (self.metrics is not None):
+            self.metrics.count('neighbours_scanned', end - start)
+
+        # Lengths of a mapped snapshot are float32, rounding restores the stored distance
+        return min_neighbour, round(min_length, 3)
+
+    def find_snapshot_neighbours(self, node, visited, collected, count):
+
+        """
+        Finds the count best neighbours of a snapshot node that aren't in the visited set, they are weighed
+        like in find_min_snapshot_neighbour and the scan stops once none of the remaining candidates can
+        beat the worst of them
+        Returns the weighted distances, indexes and lengths of the neighbours, best first
+
+        >>> graph = Graph(None, snapshot=GraphSnapshot(), weight=30)
+        >>> graph.snapshot.add_node(Brewery(brewery_id='1', beer=['a'], latitude=34, longitude=2))
+        >>> graph.snapshot.add_node(Brewery(brewery_id='2', beer=['b', 'c'], latitude=34, longitude=2.25))
+        >>> graph.snapshot.add_node(Brewery(brewery_id='3', beer=['d'], latitude=34, longitude=3))
+        >>> graph.snapshot.resolve()
+        >>> graph.insert_home(34, 1.9)
+        >>> graph.find_snapshot_neighbours(-1, set(), 0, 2)
+        [(-27.735, 1, 32.265), (-20.782, 0, 9.218)]
+        >>> graph.find_snapshot_neighbours(-1, {1}, 0, 2)
+        [(-20.782, 0, 9.218), (71.403, 2, 101.403)]
+        """
+
+        neighbours, lengths, beer_counts, remaining_beer_counts, start, end = self.snapshot_row(node)
+
+        weight = self.weight
+        beer_masks = self.snapshot.beer_masks
+        distinct_beer_counts = self.snapshot.distinct_beer_counts
+
+        # With a negative weight beers only make a candidate worse, so the bound is the length itself
+        bound_weight = max(weight, 0)
+
+        # Heap of the best neighbours with the worst one on top
+        best = []
+        limit = self.maximum_distance + 1
+
+        for position in range(start, end):
+
+            length = lengths[position]
+
+            # Stop if none of the remaining candidates can be better than the worst of the best ones
+            if (length - remaining_beer_counts[position] * bound_weight >= limit):
+                end = position
+                break
+
+            neighbour = neighbours[position]
+
+            if (length - beer_counts[position] * bound_weight >= limit or neighbour in visited):
+                continue
+
+            distance = length - (distinct_beer_counts[neighbour] - popcount(beer_masks[neighbour] & collected)) * weight
+
+            if (distance < limit):
+
+                if (len(best) == count):
+                    heapq.heapreplace(best, (-distance, neighbour, length))
+                else:
+                    heapq.heappush(best, (-distance, neighbour, length))
+
+                if (len(best) == count):
+                    limit = -best[0][0]
+
+        if (self.metrics is not None):
+            self.metrics.count('neighbours_scanned', end - start)
+
+        # Lengths of a mapped snapshot are float32, rounding restores the stored distance
+        return sorted((round(-distance, 3), neighbour, round(length, 3)) for distance, neighbour, length in best)
+
+    def snapshot_nearest_neighbour(self, result):
+
+        """
+        Generates the path using the nearest neighbour algorithm on the graph snapshot, without database lookups
+        The path is kept as node indexes and every point where the next hop wouldn't leave enough fuel to
+        return home is recorded as a cut off, only the best cut off is turned into the result
+
+        >>> graph = Graph('test.db', home_id='home')
+        >>> graph.reset()
+        >>> graph.nodes = [Brewery(brewery_id='1', latitude=34, longitude=2),
+        ...     Brewery(brewery_id='2', latitude=34, longitude=14),
+        ...     Brewery(brewery_id='3', latitude=31, longitude=10)]
+        >>> graph.generate_graph()
+        >>> graph.store_graph()
+        >>> graph.snapshot = GraphSnapshot()
+        >>> graph.snapshot.load_database('test.db')
+        >>> graph.insert_home(35, 2)
+        >>> result = SearchResults()
+        >>> result.reset()
+        >>> result = graph.snapshot_nearest_neighbour(result)
+        >>> result.return_in_json()
+        '{"breweries": [{"name": "", "id": "1", "lat": 34, "long": 2}, {"name": "", "id": "3", "lat": 31, "long": 10}], "beer": [], "distance": [0, 111.195, 820.731, 868.121]}'
+        >>> graph.database._destroy()
+        """
+
+        path, hops, beer_count, decisions = self.snapshot_route()
+
+        # Build the result only for the selected cut off
+        return self.path_result(result, path, hops)
+
+    def snapshot_route(self):
+
+        """
+        Runs the nearest neighbour algorithm on the snapshot from the inserted home node, like
+        snapshot_nearest_neighbour, without building the result
+        Returns the node indexes of the route, the lengths of the hops to them, the number of beers and the
+        decisions, the selected neighbours up to the one that ended the path
+
+        >>> graph = Graph(None, snapshot=GraphSnapshot(), weight=30)
+        >>> graph.snapshot.add_node(Brewery(brewery_id='1', beer=['a'], latitude=34, longitude=2))
+        >>> graph.snapshot.add_node(Brewery(brewery_id='2', beer=['b', 'c'], latitude=34, longitude=2.25))
+        >>> graph.snapshot.resolve()
+        >>> graph.insert_home(34, 1.9)
+        >>> graph.snapshot_route()
+        (array('l', [1]), array('d', [32.265]), 2, (1, -1))
+        """
+
+        # Indexes of the visited nodes and the lengths of the hops to them
+        path = array('l')
+        hops = array('d')
+
+        # One flag per node
+        visited = bytearray(len(self.snapshot))
+
+        # Bits of the distinct beers collected on the path and their number
+        beer = 0
+        beer_count = 0
+
+        # Path lengths, distances with the return home and the number of beers of the possible results
+        cut_offs = []
+
+        node = -1
+        min_neighbour = -1
+        distance = 0
+
+        while (distance < self.maximum_distance * 2):
+
+            # Mark node as visited
+            if (node != -1):
+                visited[node] = 1
+
+            # Find the closest neighbour
+            min_neighbour, distance_neighbour = self.find_min_snapshot_neighbour(node, visited, beer)
+
+            # If it doesn't exist, stop
+            if (min_neighbour == -1):
+                break
+
+            # Record the path so far if going further wouldn't leave enough fuel to return. By the triangle inequality
+            # every longer path doesn't leave enough either, so none of them could be a result
+            if (distance + distance_neighbour + self.distance_to_home(min_neighbour) > self.maximum_distance * 2):
+                cut_offs.append((len(path), distance + self.distance_to_home(node), beer_count))
+                break
+
+            # Update distance
+            distance += distance_neighbour
+
+            # Save data into the path
+            path.append(min_neighbour)
+            hops.append(distance_neighbour)
+            beer_count += self.snapshot.distinct_beer_counts[min_neighbour] - popcount(self.snapshot.beer_masks[min_neighbour] & beer)
+            beer |= self.snapshot.beer_masks[min_neighbour]
+
+            node = min_neighbour
+
+        cut_offs.append((len(path), distance + self.distance_to_home(node), beer_count))
+
+        if (self.metrics is not None):
+            self.metrics.count('hops', len(path))
+
+        # Find the cut off with the maximum number of beers collected, same as find_max_result
+        length = self.find_max_cut_off(cut_offs)
+        beer_count = dict((cut_off[0], cut_off[2]) for cut_off in cut_offs)[length]
+
+        return path[:length], hops[:length], beer_count, tuple(path) + (min_neighbour,)
+
+    def path_result(self, result, path, hops, improve=True, deadline=None):
+
+        """
+        Appends the snapshot nodes of the path and the lengths of the hops to them to the result, with the
+        local search the path is shortened and filled up with more breweries first, until the deadline.
+        The hop back home is added
+        """
+
+        if (improve and self.local_search and len(path) > 0):
+            path, hops = self.improve_path(path, deadline)
+        else:
+            hops = list(hops) + [self.distance_to_home(path[-1] if len(path) > 0 else -1)]
+
+        # Beer names are only decoded here
+        for position in range(len(path)):
+            result.factories.append(self.snapshot.node(path[position]))
+            result.distance.append(hops[position])
+            result.beer |= set(self.snapshot.beer(path[position]))
+
+            if (result.fragments is not None):
+                result.fragments.append(self.snapshot.fragments[path[position]])
+
+        result.distance.append(hops[-1])
 
         return result
 
-    def genetic_near_neighbour(self, number_of_runs, latitude, longitude):
+    def improve_path(self, path, deadline=None):
 
         """
-        Runs genetic algorithm for nearest neigbour algorithm
+        Shortens the path of snapshot nodes with 2-opt and or-opt moves, then spends the fuel that is left on
+        inserting the breweries that add the most new beers per kilometre, until no brewery fits anymore
+        Distances between the nodes of the path are kept in a table, so every move is checked in constant time
+        Once the deadline (time.time() value) passes no more moves are made, every move keeps the path valid
+        Returns the new path and the lengths of its hops, the last hop leads back home
+
+        >>> graph = Graph(None, snapshot=GraphSnapshot(), maximum_distance=250)
+        >>> for brewery_id, beer, latitude, longitude in [('1', ['a'], 0, 1), ('2', ['b'], 1, 1), ('3', ['c'], 1, 0), ('4', ['d'], 0.5, 1.2)]:
+        ...     graph.snapshot.add_node(Brewery(brewery_id=brewery_id, beer=beer, latitude=latitude, longitude=longitude))
+        >>> graph.snapshot.resolve()
+        >>> graph.insert_home(0, 0)
+        >>> path, hops = graph.improve_path(array('l', [1, 0, 2]))
+        >>> list(path), hops, round(sum(hops), 3)
+        ([0, 3, 1, 2], [111.195, 59.88, 59.88, 111.178, 111.195], 453.328)
+        >>> path, hops = graph.improve_path(array('l', [1, 0, 2]), deadline=0)
+        >>> list(path), round(sum(hops), 3)
+        ([1, 0, 2], 536.888)
         """
 
-        # Creates SearchResults object to store the final result
-        final_result = SearchResults()
-        final_result.reset()
+        # Home is the first node of the table, the tour starts and ends there
+        nodes = [-1] + list(path)
+        tour = list(range(len(nodes))) + [0]
 
-        # Sets the initial values
-        max_number_of_beer = 0
-        org_weight = 10
-        new_weight = 10
+        # Distances between the breweries come from the distance matrix of the snapshot if it is loaded
+        home_row = numpy.array([0.0] + [self.distance_to_home(node) for node in path])
+        table = numpy.block([[home_row[None, :]], [home_row[1:, None], self.snapshot.pair_distances(path, path)]])
 
-        # Runs the genetic algorithm number_or_runs times
-        for i in range(number_of_runs):
+        # Every node of a tour that fits into the fuel is within the maximum distance of home, so the breweries
+        # that can be inserted are the home connections, their distances to the nodes of the table are kept too
+        candidates = numpy.asarray(self.home_neighbours, dtype=numpy.int64)
+        candidate_distances = numpy.vstack([numpy.asarray(self.home_lengths), self.snapshot.pair_distances(path, candidates)])
+        available = numpy.isin(candidates, nodes, invert=True)
 
-            # sets the weight to the mutated one
-            self.weight = new_weight
+        # Bits of the beers collected on the path
+        beer = 0
 
-            # Runs the neares neighbour algorithm with a mutated weight
-            temp_result = self.find_path(latitude, longitude)
+        for node in path:
+            beer |= self.snapshot.beer_masks[node]
 
-            # Checks if more beers were found than previous maximum
-            if (len(temp_result.beer) > max_number_of_beer):
-                
-                # sets the maximum number of beer to the new maximum
-                max_number_of_beer = len(temp_result.beer)
+        inserted = True
 
-                # sets the orginal best weight to the new weight
-                org_weight = new_weight
+        # Breweries are inserted until none of them fits, then the tour is shortened again to make room for more
+        while (inserted):
 
-                # Updates the final result
-                final_result = temp_result
-            else:
+            self.shorten_tour(tour, table, deadline)
 
-                # resets the weith
-                new_weight = org_weight
+            inserted = False
 
-            # Decides if to add or subtract the mutation
-            is_negative = random.randint(0, 1)
+            while True:
 
-            if (is_negative == 1):
+                # Stop when the time is up
+                if (deadline is not None and time.time() >= deadline):
+                    break
 
-                # Generates mutation and substrcts it
-                new_weight -= random.random() * 10
-            else:
+                insertion = self.find_insertion(tour, table, candidates, candidate_distances, available, beer)
 
-                # Generates mutation and adds it
-                new_weight += random.random() * 10
+                if (insertion is None):
+                    break
 
+                candidate, place = insertion
+                node = int(candidates[candidate])
 
-        return final_result
+                # Add the brewery to the tour and its distances to the tables
+                row = candidate_distances[:, candidate]
+                table = numpy.block([[table, row[:, None]], [row[None, :], numpy.zeros((1, 1))]])
 
+                candidate_distances = numpy.vstack([candidate_distances, self.snapshot.pair_distances([node], candidates)])
 
-if __name__ == '__main__':
-    if (len(sys.argv) > 1 and sys.argv[1] == '-r'):
-        GraphDB('beer.db')._destroy()
-        graph = Graph('beer.db')
-        graph.generate_and_store_graph()
+                nodes.append(node)
+                available[candidate] = False
+                tour.insert(place + 1, len(nodes) - 1)
+
+                beer |= self.snapshot.beer_masks[node]
+                inserted = True
+
+                if (self.metrics is not None):
+                    self.metrics.count('inserted_breweries')
+
+        path = array('l', [nodes[position] for position in tour[1:-1]])
+        hops = table[tour[:-1], tour[1:]].tolist()
+
+        return path, hops
+
+    def shorten_tour(self, tour, table, deadline=None):
+
+        """
+        Applies 2-opt moves, which reverse a part of the tour, and or-opt moves, which move up to three
+        consecutive nodes somewhere else, the move that saves the most is applied until none of them saves anything
+        or the deadline (time.time() value) passes. The changes in length of all of the moves are read from the
+        table at once, new hops have to be within the maximum distance like the connections of the graph
+
+        >>> graph = Graph(None, maximum_distance=10)
+        >>> table = numpy.array([[0, 1, 2, 1], [1, 0, 1, 2], [2, 1, 0, 1], [1, 2, 1, 0]])
+        >>> tour = [0, 2, 1, 3, 0]
+        >>> graph.shorten_tour(tour, table)
+        >>> tour
+        [0, 1, 2, 3, 0]
+        """
+
+        maximum_distance = self.maximum_distance
+
+        while (len(tour) > 3):
+
+            # Stop when the time is up
+            if (deadline is not None and time.time() >= deadline):
+                break
+
+            nodes = numpy.array(tour)
+            hops = table[nodes[:-1], nodes[1:]]
+
+            best_saving = 1e-6
+            best_move = None
+
+            # 2-opt, reverse the nodes from position i to position j, the hops (i - 1, i) and (j, j + 1) are replaced
+            i = numpy.arange(1, len(tour) - 2)[:, None]
+            j = numpy.arange(2, len(tour) - 1)[None, :]
+
+            first_hops = table[nodes[i - 1], nodes[j]]
+            second_hops = table[nodes[i], nodes[j + 1]]
+
+            savings = hops[i - 1] + hops[j] - first_hops - second_hops
+            savings[(j <= i) | (first_hops > maximum_distance) | (second_hops > maximum_distance)] = 0
+
+            if (savings.size > 0 and savings.max() > best_saving):
+                position = numpy.unravel_index(numpy.argmax(savings), savings.shape)
+                best_saving = savings[position]
+                best_move = ('2-opt', position[0] + 1, position[1] + 2, False)
+
+            # Or-opt, move the segment from position i to position j between the nodes k and k + 1, in either direction
+            k = numpy.arange(len(tour) - 1)[None, :]
+
+            for size in range(1, 4):
+
+                i = numpy.arange(1, len(tour) - size)[:, None]
+                j = i + size - 1
+
+                closing_hops = table[nodes[i - 1], nodes[j + 1]]
+
+                # Length saved by taking the segment out of the tour
+                removal_savings = hops[i - 1] + hops[j] - closing_hops
+
+                for reverse in (False, True):
+
+                    first, last = (j, i) if reverse else (i, j)
+
+                    first_hops = table[nodes[k], nodes[first]]
+                    second_hops = table[nodes[last], nodes[k + 1]]
+
+                    savings = removal_savings - (first_hops + second_hops - hops[k])
+                    savings[((i - 1 <= k) & (k <= j)) | (closing_hops > maximum_distance) |
+                            (first_hops > maximum_distance) | (second_hops > maximum_distance)] = 0
+
+                    if (savings.size > 0 and savings.max() > best_saving):
+                        position = numpy.unravel_index(numpy.argmax(savings), savings.shape)
+                        best_saving = savings[position]
+                        best_move = ('or-opt', position[0] + 1, position[1], reverse, size)
+
+            if (best_move is None):
+                break
+
+            if (self.metrics is not None):
+                self.metrics.count('local_search_moves')
+
+            if (best_move[0] == '2-opt'):
+                move, start, end, reverse = best_move
+                tour[start:end + 1] = reversed(tour[start:end + 1])
+            else:
+                move, start, after, reverse, size = best_move
+                segment = tour[start:start + size]
+
+                if (reverse):
+                    segment.reverse()
+
+                # Insert the segment after the node at position k, its position shifts if it comes after the segment
+                del tour[start:start + size]
+                position = after + 1 if after < start else after + 1 - size
+                tour[position:position] = segment
+
+    def find_insertion(self, tour, table, candidates, candidate_distances, available, beer):
+
+        """
+        Finds the available candidate with the most new beers per kilometre of detour that fits into the fuel
+        that is left and the cheapest place to insert it, the distances of the candidates to the nodes of the
+        table are in the rows of candidate_distances
+        Returns the position of the candidate and the position of the tour after which it goes, or None if none fits
+        """
+
+        hops = table[tour[:-1], tour[1:]]
+        fuel = self.maximum_distance * 2 - hops.sum()
+
+        if (fuel <= 0 or not available.any()):
+            return None
+
+        # Detour of inserting each candidate after each node of the tour
+        distances = candidate_distances[tour]
+        detours = distances[:-1] + distances[1:] - hops[:, None]
+
+        # Detours with hops that aren't connections of the graph don't fit, neither do the visited candidates
+        detours[(distances[:-1] > self.maximum_distance) | (distances[1:] > self.maximum_distance)] = numpy.inf
+        detours[:, ~available] = numpy.inf
+
+        places = numpy.argmin(detours, axis=0)
+        costs = detours[places, numpy.arange(len(candidates))]
+
+        best = -1
+        best_score = 0
+
+        for candidate in numpy.flatnonzero(costs <= fuel).tolist():
+
+            node = int(candidates[candidate])
+            new_beers = self.snapshot.distinct_beer_counts[node] - popcount(self.snapshot.beer_masks[node] & beer)
+
+            score = new_beers / max(costs[candidate], 1e-6)
+
+            if (new_beers > 0 and score > best_score):
+                best = candidate
+                best_score = score
+
+        if (best == -1):
+            return None
+
+        return best, int(places[best])
+
+    def find_max_cut_off(self, cut_offs):
+
+        """
+        Find the path length of the cut off with the maximum number of beers collected
+
+        >>> graph = Graph(None)
+        >>> graph.find_max_cut_off([(2, 1900, 5), (3, 2100, 9), (4, 1990, 7), (5, 1999, 7)])
+        4
+        >>> graph.find_max_cut_off([(2, 2100, 5)])
+        2
+        """
+
+        # sets initial values
+        maximum_beer = 0
+        max_result = 0
+
+        for i in range(len(cut_offs)):
+
+            length, distance_sum, amount_of_beer = cut_offs[i]
+
+            # if distance sum is less than the fuel of the aircraft and the number of beer collected is more then the previous maximum
+            if (distance_sum <= self.maximum_distance * 2 and amount_of_beer > maximum_beer):
+                maximum_beer = amount_of_beer
+                max_result = i
+
+        return cut_offs[max_result][0]
+
+    def find_path(self, latitude, longitude):
+
+        # Create home node and connect it with other nodes
+        self.insert_home(latitude, longitude)
+
+        result = self.find_path_from_home()
+
+        # Remove home node and it's connections
+        self.remove_home()
+
+        return result
+
+    def find_path_from_home(self):
+
+        """
+        Finds the path starting from the already inserted home node
+        """
+
+        # Retrieve home node
+        home_node = self.home_node
+
+        if (self.metrics is not None):
+            self.metrics.count('nearest_neighbour_runs')
+
+        # Initilize the SearchResults object to store search results
+        result = SearchResults()
+
+        # After the reinitilization the old value of the object is kept, so it is reset
+        result.reset()
+
+        # Append home node to the begining of the results
+        result.factories.append(home_node)
+        
+        # Find path using nearest neighbour algorithm, on the snapshot if it is loaded
+        if (self.snapshot is not None):
+
+            # Json of the snapshot nodes is precomputed, only the home node is encoded
+            home_fragment = brewery_in_json(home_node.name, home_node.brewery_id, home_node.latitude, home_node.longitude)
+            result.fragments = [home_fragment]
+
+            result = self.snapshot_nearest_neighbour(result)
+
+            result.fragments.append(home_fragment)
+        else:
+            result = self.nearest_neighbour(self.home_id, 0, [], [result])
+
+        # Retrieve last brewery
+        last_node = result.factories[-1]
+
+        # Append home node to the back
+        result.factories.append(home_node)
+
+        return result
+
+    def route_result(self, path, hops, improve=True, deadline=None):
+
+        """
+        Builds the result of a snapshot route from the inserted home node and back, with the local search
+        until the deadline if it is enabled and the route is to be improved
+        """
+
+        result = SearchResults()
+        result.reset()
+
+        # Json of the snapshot nodes is precomputed, only the home node is encoded
+        home_fragment = brewery_in_json(self.home_node.name, self.home_node.brewery_id, self.home_node.latitude, self.home_node.longitude)
+        result.factories.append(self.home_node)
+        result.fragments = [home_fragment]
+
+        result = self.path_result(result, path, hops, improve, deadline)
+
+        result.factories.append(self.home_node)
+        result.fragments.append(home_fragment)
+
+        return result
+
+    def mutate_weight(self, weight, generator):
+
+        """
+        Adds or subtracts a random mutation from the weight
+
+        >>> graph = Graph(None)
+        >>> round(graph.mutate_weight(10, random.Random(1)), 6)
+        15.692039
+        """
+
+        # Decides if to add or subtract the mutation
+        is_negative = generator.randint(0, 1)
+
+        if (is_negative == 1):
+
+            # Generates mutation and substrcts it
+            return weight - generator.random() * 10
+        else:
+
+            # Generates mutation and adds it
+            return weight + generator.random() * 10
+
+    def genetic_near_neighbour(self, number_of_runs, latitude, longitude, seed=None, deadline=None, progress=None):
+
+        """
+        Runs genetic algorithm for nearest neigbour algorithm, the seed makes the mutations reproducible
+        Once the deadline (time.time() value) passes no more runs are started and the best result so far is returned,
+        the runs leave a tenth of the time for the local search and the number of runs that were done is kept in
+        completed_runs. Without a number of runs the search keeps improving the result until the deadline
+        On the snapshot a weight between two weights that made the same decisions isn't searched and doesn't count
+        as a run, once 100 mutations in a row only find known routes the search stops and converged is set.
+        Progress is called with the result of every route that has more beers than the ones before, without the local search
+
+        >>> graph = Graph(None, snapshot=GraphSnapshot(), metrics=Metrics())
+        >>> graph.snapshot.add_node(Brewery(brewery_id='1', beer=['a'], latitude=34, longitude=2))
+        >>> graph.snapshot.resolve()
+        >>> [factory.brewery_id for factory in graph.genetic_near_neighbour(3, 35, 2).factories], graph.completed_runs
+        (['home', '1', 'home'], 3)
+        >>> len(graph.genetic_near_neighbour(3, 35, 2, deadline=0).factories), graph.completed_runs
+        (0, 0)
+        >>> graph.metrics = Metrics()
+        >>> len(graph.genetic_near_neighbour(20, 35, 2, seed=1).factories), graph.completed_runs, graph.converged
+        (3, 15, True)
+        >>> graph.metrics.counters['nearest_neighbour_runs'], graph.metrics.counters['repeated_routes']
+        (15, 339)
+        >>> len(graph.genetic_near_neighbour(None, 35, 2, deadline=time.time() + 60).factories), graph.completed_runs < 100, graph.converged
+        (3, True, True)
+        >>> improved = []
+        >>> len(graph.genetic_near_neighbour(3, 35, 2, progress=improved.append).factories), [len(result.factories) for result in improved]
+        (3, [3])
+        """
+
+        generator = random.Random(seed)
+
+        # Sets the initial values
+        max_number_of_beer = 0
+        org_weight = 10
+        new_weight = 10
+
+        self.completed_runs = 0
+        self.converged = False
+
+        # Home node is inserted once and shared by all of the runs
+        stage_start = time.perf_counter()
+        self.insert_home(latitude, longitude)
+        self.record_time('insert_home', stage_start)
+        stage_start = time.perf_counter()
+
+        # Number of beers and the lowest and highest weight of each sequence of decisions found on the snapshot.
+        # Every decision selects the neighbour with the lowest weighted distance, which is linear in the weight,
+        # so the weights between two that make the same decisions make them too. Such a weight isn't searched
+        # and doesn't count as a run
+        routes = {}
+        best_route = None
+        repeated_runs = 0
+
+        runs_deadline = self.runs_deadline(deadline)
+
+        # Runs the genetic algorithm number_or_runs times or until the deadline
+        while (number_of_runs is None or self.completed_runs < number_of_runs):
+
+            # Stop when the time is up
+            if (runs_deadline is not None and time.time() >= runs_deadline):
+                break
+
+            # With a snapshot the runs only look for the route, only the best one becomes a result
+            if (self.snapshot is not None):
+
+                beer_count = self.find_route_beer_count(routes, new_weight)
+
+                if (beer_count is None):
+                    self.weight = new_weight
+
+                    if (self.metrics is not None):
+                        self.metrics.count('nearest_neighbour_runs')
+
+                    path, hops, beer_count, decisions = self.snapshot_route()
+                    route = (path, hops)
+
+                    if (decisions in routes):
+                        routes[decisions][1] = min(routes[decisions][1], new_weight)
+                        routes[decisions][2] = max(routes[decisions][2], new_weight)
+                    else:
+                        routes[decisions] = [beer_count, new_weight, new_weight]
+
+                    repeated_runs = 0
+                else:
+                    repeated_runs += 1
+
+                    if (self.metrics is not None):
+                        self.metrics.count('repeated_routes')
+
+                    # The mutations around the best weight only find known routes, more runs wouldn't either
+                    if (repeated_runs >= 100):
+                        self.converged = True
+                        break
+            else:
+
+                # sets the weight to the mutated one
+                self.weight = new_weight
+
+                # Runs the neares neighbour algorithm with a mutated weight
+                route = self.find_path_from_home()
+                beer_count = len(route.beer)
+
+            # Checks if more beers were found than previous maximum
+            if (beer_count > max_number_of_beer):
+                
+                # sets the maximum number of beer to the new maximum
+                max_number_of_beer = beer_count
+
+                # sets the orginal best weight to the new weight
+                org_weight = new_weight
+
+                # Updates the best route
+                best_route = route
+
+                # Improvements are reported as they are found, only the final result gets the local search
+                if (progress is not None):
+                    progress(route if self.snapshot is None else self.route_result(*route, improve=False))
+            else:
+
+                # resets the weith
+                new_weight = org_weight
+
+            new_weight = self.mutate_weight(new_weight, generator)
+
+            if (repeated_runs == 0):
+                self.completed_runs += 1
+
+        self.record_time('nearest_neighbour', stage_start)
+
+        if (self.metrics is not None):
+            self.metrics.count('genetic_iterations', self.completed_runs)
+
+        # Only the best route becomes a result, improving it once is cheaper than improving every run
+        if (best_route is None):
+            final_result = SearchResults()
+            final_result.reset()
+        elif (self.snapshot is not None):
+            stage_start = time.perf_counter()
+            self.weight = org_weight
+            final_result = self.route_result(*best_route, deadline=deadline)
+
+            if (self.local_search):
+                self.record_time('local_search', stage_start)
+        else:
+            final_result = best_route
+
+        self.remove_home()
+
+        return final_result
+
+    def find_route_beer_count(self, routes, weight):
+
+        """
+        Returns the number of beers of the known decisions that the weight surely makes again, otherwise None
+
+        >>> graph = Graph(None)
+        >>> routes = {(1, 2, -1) : [5, 3.0, 8.5], (2, 1, -1) : [4, 10.0, 12.0]}
+        >>> graph.find_route_beer_count(routes, 11), graph.find_route_beer_count(routes, 9)
+        (4, None)
+        """
+
+        for beer_count, low, high in routes.values():
+            if (low <= weight <= high):
+                return beer_count
+
+        return None
+
+    def parallel_genetic_near_neighbour(self, number_of_runs, latitude, longitude, executor, workers, population_size=8, seed=None, deadline=None):
+
+        """
+        Runs genetic algorithm for nearest neighbour algorithm, each generation is a population of weights
+        mutated from the best weight so far and it is evaluated in parallel by the executor's worker processes,
+        which search their own copy of the snapshot. The seed makes the result reproducible
+        Once the deadline (time.time() value) passes the evaluations that didn't finish are dropped and the best
+        result so far is returned, the generations leave a tenth of the time for the local search and the number
+        of runs that were evaluated is kept in completed_runs. Without a number of runs the generations continue
+        until the deadline
+        """
+
+        generator = random.Random(seed)
+
+        # Creates SearchResults object to store the final result
+        final_result = SearchResults()
+        final_result.reset()
+
+        # Sets the initial values
+        max_number_of_beer = 0
+        org_weight = 10
+        runs = 0
+
+        self.completed_runs = 0
+
+        runs_deadline = self.runs_deadline(deadline)
+
+        while (number_of_runs is None or runs < number_of_runs):
+
+            # Stop when the time is up
+            if (runs_deadline is not None and time.time() >= runs_deadline):
+                break
+
+            # The first generation starts with the initial weight, like the sequential algorithm
+            size = population_size if number_of_runs is None else min(population_size, number_of_runs - runs)
+
+            if (runs == 0):
+                population = [org_weight] + [self.mutate_weight(org_weight, generator) for i in range(size - 1)]
+            else:
+                population = [self.mutate_weight(org_weight, generator) for i in range(size)]
+
+            runs += size
+
+            # Splits the population into one contiguous chunk per worker, so the order of the results is fixed
+            chunk_size = -(-size // workers)
+            chunks = [population[start:start + chunk_size] for start in range(0, size, chunk_size)]
+
+            futures = []
+
+            try:
+                for chunk in chunks:
+                    futures.append(executor.submit(evaluate_weights, self.snapshot.database_directory, self.maximum_distance,
+                            latitude, longitude, chunk))
+            except SearchQueueFull:
+
+                # The generation doesn't fit into the queue, the best result so far is returned
+                for future in futures:
+                    future.cancel()
+
+                break
+
+            for chunk, future in zip(chunks, futures):
+
+                try:
+                    counts, temp_result = future.result(timeout=None if runs_deadline is None else max(0, runs_deadline - time.time()))
+                except TimeoutError:
+
+                    # Evaluations that didn't start yet are dropped, the ones that did are left to finish
+                    for future in futures:
+                        future.cancel()
+
+                    return self.improve_result(final_result, org_weight, latitude, longitude, executor, deadline)
+
+                self.completed_runs += len(chunk)
+
+                # Checks if more beers were found than previous maximum
+                if (max(counts) > max_number_of_beer):
+
+                    # updates the maximum number of beer, the best weight and the final result
+                    max_number_of_beer = max(counts)
+                    org_weight = chunk[counts.index(max_number_of_beer)]
+                    final_result = temp_result
+
+        return self.improve_result(final_result, org_weight, latitude, longitude, executor, deadline)
+
+    def improve_result(self, result, weight, latitude, longitude, executor, deadline=None):
+
+        """
+        Searches the path of the weight again with the local search in one of the executor's worker processes,
+        if it is enabled, the result isn't empty and the deadline (time.time() value) didn't pass. The local
+        search stops at the deadline, the result is returned unimproved if the job doesn't fit into the queue
+        or doesn't finish within a second of slack
+        """
+
+        if (self.metrics is not None):
+            self.metrics.count('genetic_iterations', self.completed_runs)
+
+        if (not self.local_search or self.snapshot is None or len(result.factories) == 0):
+            return result
+
+        if (deadline is not None and time.time() >= deadline):
+            return result
+
+        stage_start = time.perf_counter()
+
+        try:
+            future = executor.submit(improve_weight, self.snapshot.database_directory, self.maximum_distance, latitude, longitude, weight, deadline)
+        except SearchQueueFull:
+            return result
+
+        try:
+            result = future.result(timeout=None if deadline is None else max(0, deadline + 1 - time.time()))
+        except TimeoutError:
+            future.cancel()
+
+        self.record_time('local_search', stage_start)
+
+        return result
+
+    def beam_search(self, beam_width, latitude, longitude, expansions=3, weight=20, deadline=None):
+
+        """
+        Searches the path with a beam of partial paths instead of a single greedy one. Every path of the beam
+        is extended with its expansions best neighbours that leave enough fuel to return home, paths that
+        visit the same breweries and end in the same one are merged, and the beam_width paths with the most
+        distinct beers per kilometre of the round trip are kept. Paths that can't collect more beers than the
+        best path found, even with all of the beers that are left within reach of their fuel, are dropped
+        The work is bounded by beam_width * expansions neighbour scans per brewery of the path
+        The neighbours are ranked with the weight instead of the weight of the graph, the beam already keeps
+        the paths with the most beers so a strong beer bonus works better than the one of a single greedy path
+        Once the deadline (time.time() value) passes the best path so far is returned, finished tells whether the
+        beam ran out of paths before, beam_levels holds the number of levels that were expanded and beam_truncated
+        whether paths were dropped to keep the beam at its width
+
+        >>> graph = Graph(None, maximum_distance=200, weight=0, local_search=False)
+        >>> graph.nodes = [Brewery(brewery_id='1', beer=['a'], latitude=0, longitude=0.5),
+        ...     Brewery(brewery_id='2', beer=['b', 'c', 'd'], latitude=0, longitude=-1),
+        ...     Brewery(brewery_id='3', beer=['e'], latitude=0, longitude=1)]
+        >>> graph.generate_graph()
+        >>> graph.snapshot = graph.generate_snapshot()
+        >>> [factory.brewery_id for factory in graph.find_path(0, 0).factories]
+        ['home', '1', '3', 'home']
+        >>> result = graph.beam_search(4, 0, 0)
+        >>> [factory.brewery_id for factory in result.factories], len(result.beer), graph.finished, graph.beam_levels, graph.beam_truncated
+        (['home', '1', '2', 'home'], 4, True, 3, False)
+        >>> len(graph.beam_search(1, 0, 0).beer), graph.finished, graph.beam_truncated
+        (4, True, True)
+        >>> len(graph.beam_search(4, 0, 0, deadline=0).factories), graph.finished, graph.beam_levels
+        (0, False, 0)
+        """
+
+        self.insert_home(latitude, longitude)
+
+        graph_weight = self.weight
+        self.weight = weight
+
+        fuel = self.maximum_distance * 2
+        beer_masks = self.snapshot.beer_masks
+        distinct_beer_counts = self.snapshot.distinct_beer_counts
+
+        # Beers of the breweries up to each position of the home row, which is sorted by distance. A brewery
+        # that a path with the fuel f left at the distance d from home can still visit is within (f + d) / 2
+        # of home, so the beers up to there bound the beers the path can still collect
+        reachable = []
+        beers_within = 0
+
+        for node in self.home_neighbours:
+            beers_within |= beer_masks[node]
+            reachable.append(beers_within)
+
+        # Paths are tuples of the nodes, the hop lengths, the distance, the beer mask and the beer count
+        best = ((), (), 0, 0, 0)
+        beam = [best]
+
+        levels = 0
+        truncated = False
+
+        runs_deadline = self.runs_deadline(deadline)
+
+        while (len(beam) > 0):
+
+            # Stop when the time is up
+            if (runs_deadline is not None and time.time() >= runs_deadline):
+                break
+
+            children = {}
+
+            for path, hops, distance, beer, beer_count in beam:
+
+                visited = set(path)
+
+                for weighted_distance, neighbour, length in self.find_snapshot_neighbours(path[-1] if len(path) > 0 else -1,
+                        visited, beer, expansions):
+
+                    # Only paths that can return home are kept
+                    if (distance + length + self.distance_to_home(neighbour) > fuel):
+                        continue
+
+                    # Fingerprint of the visited breweries and the last one, the shorter path of the same ones is kept
+                    fingerprint = (neighbour, frozenset(visited) | {neighbour})
+
+                    if (fingerprint in children and children[fingerprint][2] <= distance + length):
+                        continue
+
+                    children[fingerprint] = (path + (neighbour,), hops + (length,), distance + length, beer | beer_masks[neighbour],
+                            beer_count + distinct_beer_counts[neighbour] - popcount(beer_masks[neighbour] & beer))
+
+            levels += 1
+
+            for child in children.values():
+                if (child[4] > best[4] or (child[4] == best[4] and child[2] < best[2])):
+                    best = child
+
+            # Drop the paths that can't collect more beers than the best one
+            candidates = []
+
+            for child in children.values():
+
+                radius = (fuel - child[2] + self.distance_to_home(child[0][-1])) / 2
+                position = bisect.bisect_right(self.home_lengths, radius) - 1
+
+                if (position >= 0 and child[4] + popcount(reachable[position] & ~child[3]) > best[4]):
+                    candidates.append(child)
+
+            # Keep the paths with the most beers per kilometre of the round trip
+            truncated = truncated or len(candidates) > beam_width
+            beam = heapq.nlargest(beam_width, candidates,
+                    key=lambda child: (child[4] / (child[2] + self.distance_to_home(child[0][-1])), -child[2]))
+
+        self.weight = graph_weight
+        self.finished = len(beam) == 0
+        self.beam_levels = levels
+        self.beam_truncated = truncated
+
+        if (self.metrics is not None):
+            self.metrics.count('beam_levels', levels)
+
+        result = SearchResults()
+        result.reset()
+
+        if (len(best[0]) > 0):
+            result = self.route_result(array('l', best[0]), best[1], deadline=deadline)
+
+        self.remove_home()
+
+        return result
+
+    def runs_deadline(self, deadline):
+
+        """
+        Returns the deadline of the runs of a search, the last tenth of the time until the deadline (time.time()
+        value) is left for the local search of the best route if it is enabled
+
+        >>> graph = Graph(None, snapshot=GraphSnapshot())
+        >>> graph.runs_deadline(None), graph.runs_deadline(0), round(time.time() + 10 - graph.runs_deadline(time.time() + 10))
+        (None, 0.0, 1)
+        """
+
+        if (deadline is None or not self.local_search or self.snapshot is None):
+            return deadline
+
+        return deadline - max(0, deadline - time.time()) / 10
+
+    def record_time(self, stage, start):
+
+        """
+        Adds the time since start (a time.perf_counter() value) to the stage, if the graph has metrics
+        """
+
+        if (self.metrics is not None):
+            self.metrics.record_time(stage, start)
+
+def evaluate_weights(database_directory, maximum_distance, latitude, longitude, weights):
+
+    """
+    Runs the nearest neighbour algorithm for every weight inside of a worker process
+    Returns the number of beers found with each weight and the first result with the most beers
+
+    >>> graph = Graph('test.db')
+    >>> graph.reset()
+    >>> graph.nodes = [Brewery(brewery_id='1', beer=['a'], latitude=34, longitude=2),
+    ...     Brewery(brewery_id='2', beer=['b', 'c'], latitude=34, longitude=14),
+    ...     Brewery(brewery_id='3', beer=['d'], latitude=31, longitude=10)]
+    >>> graph.generate_graph()
+    >>> graph.store_graph()
+    >>> counts, result = evaluate_weights('test.db', 1000, 35, 2, [10, -500])
+    >>> counts, [factory.brewery_id for factory in result.factories]
+    ([2, 1], ['home', '1', '3', 'home'])
+    >>> graph.database._destroy()
+    """
+
+    # The local search is applied once to the best weight by the caller
+    graph = Graph(None, maximum_distance=maximum_distance, snapshot=load_snapshot(database_directory), local_search=False)
+
+    graph.insert_home(latitude, longitude)
+
+    counts = []
+    best_result = None
+
+    for weight in weights:
+
+        graph.weight = weight
+
+        result = graph.find_path_from_home()
+
+        counts.append(len(result.beer))
+
+        if (best_result is None or len(result.beer) > len(best_result.beer)):
+            best_result = result
+
+    graph.remove_home()
+
+    return counts, best_result
+
+def improve_weight(database_directory, maximum_distance, latitude, longitude, weight, deadline=None):
+
+    """
+    Runs the nearest neighbour algorithm with the weight and improves its route with the local search until
+    the deadline (time.time() value) inside of a worker process
+
+    >>> graph = Graph('test.db')
+    >>> graph.reset()
+    >>> graph.nodes = [Brewery(brewery_id='1', beer=['a'], latitude=34, longitude=2),
+    ...     Brewery(brewery_id='2', beer=['b', 'c'], latitude=34, longitude=14),
+    ...     Brewery(brewery_id='3', beer=['d'], latitude=31, longitude=10)]
+    >>> graph.generate_graph()
+    >>> graph.store_graph()
+    >>> [factory.brewery_id for factory in improve_weight('test.db', 1000, 35, 2, 10).factories]
+    ['home', '1', '3', 'home']
+    >>> graph.database._destroy()
+    """
+
+    graph = Graph(None, maximum_distance=maximum_distance, snapshot=load_snapshot(database_directory), weight=weight)
+
+    graph.insert_home(latitude, longitude)
+
+    path, hops, beer_count, decisions = graph.snapshot_route()
+
+    result = graph.route_result(path, hops, deadline=deadline)
+
+    graph.remove_home()
+
+    return result
+
+def search_path(database_directory, maximum_distance, latitude, longitude, number_of_runs, seed=None, deadline=None, metrics=None,
+        profile_path=None, solver='genetic', progress=None):
+
+    """
+    Runs the genetic algorithm or with the 'beam' solver the beam search for one request inside of a worker process
+    Returns the result, the number of runs that were done before the deadline, whether the genetic algorithm
+    converged before doing all of them, the levels a beam of the requested width expanded before the deadline
+    cut it off (None otherwise) and the metrics if they were passed,
+    with a profile path the search is profiled and the statistics are written there. With a progress queue the
+    json of every improved result is put into it while the search runs and None is put at the end
+
+    >>> graph = Graph('search_test.db')
+    >>> graph.reset()
+    >>> graph.nodes = [Brewery(brewery_id='1', beer=['a'], latitude=34, longitude=2),
+    ...     Brewery(brewery_id='2', beer=['b', 'c'], latitude=34, longitude=14)]
+    >>> graph.generate_graph()
+    >>> graph.store_graph()
+    >>> result, completed_runs, converged, beam_levels, metrics = search_path('search_test.db', 1000, 35, 2, 5, seed=1)
+    >>> [factory.brewery_id for factory in result.factories], completed_runs, metrics
+    (['home', '1', 'home'], 5, None)
+    >>> result, completed_runs, converged, beam_levels, metrics = search_path('search_test.db', 1000, 35, 2, 5, seed=1, metrics=Metrics())
+    >>> metrics.counters['genetic_iterations'], metrics.counters['nearest_neighbour_runs'], sorted(metrics.seconds)
+    (5, 5, ['insert_home', 'local_search', 'nearest_neighbour'])
+    >>> result, completed_runs, converged, beam_levels, metrics = search_path('search_test.db', 1000, 35, 2, 5, solver='beam')
+    >>> [factory.brewery_id for factory in result.factories], completed_runs, beam_levels
+    (['home', '1', 'home'], 5, None)
+    >>> result, completed_runs, converged, beam_levels, metrics = search_path('search_test.db', 1000, 35, 2, 5, solver='beam', deadline=0)
+    >>> len(result.factories), completed_runs, beam_levels
+    (0, 0, 0)
+    >>> result, completed_runs, converged, beam_levels, metrics = search_path('search_test.db', 1000, 35, 2, 0, solver='beam')
+    >>> len(result.factories), completed_runs, beam_levels
+    (0, 0, None)
+    >>> from queue import Queue
+    >>> progress = Queue()
+    >>> result, completed_runs, converged, beam_levels, metrics = search_path('search_test.db', 1000, 35, 2, 5, seed=1, progress=progress)
+    >>> progress.get(), progress.get()
+    ('{"breweries": [{"name": "", "id": "home", "lat": 35, "long": 2}, {"name": "", "id": "1", "lat": 34, "long": 2}, {"name": "", "id": "home", "lat": 35, "long": 2}], "beer": ["a"], "distance": [0, 111.195, 111.195], "progress": true}', None)
+    >>> graph.database._destroy()
+    """
+
+    graph = Graph(None, maximum_distance=maximum_distance, snapshot=load_snapshot(database_directory), metrics=metrics)
+
+    report = None
+
+    if (progress is not None):
+        report = lambda result: progress.put(result.return_in_json({'progress' : True}))
+
+    if (solver == 'beam'):
+        search = lambda: beam_search(graph, number_of_runs, latitude, longitude, deadline, progress=report)
+    else:
+        search = lambda: graph.genetic_near_neighbour(number_of_runs, latitude, longitude, seed=seed, deadline=deadline, progress=report)
+
+    try:
+        if (profile_path is not None):
+            profile = cProfile.Profile()
+            result = profile.runcall(search)
+            profile.dump_stats(profile_path)
+        else:
+            result = search()
+    finally:
+
+        # The reader stops waiting for improvements
+        if (progress is not None):
+            progress.put(None)
+
+    beam_levels = None
+
+    # A beam of the requested width that the deadline cut off is a partial result, it reports the levels it expanded
+    if (solver == 'beam' and number_of_runs and not graph.finished):
+        beam_levels = graph.beam_levels
+
+    return result, graph.completed_runs, graph.converged, beam_levels, metrics
+
+def beam_search(graph, beam_width, latitude, longitude, deadline, initial_width=8, progress=None):
+
+    """
+    Runs the beam search with the beam width, without one the beam starts at the initial width and is
+    doubled as long as the next beam fits into the time left before the deadline and the last one could
+    still find more, progress is called with the result of every wider beam that finds more beers. Returns
+    the result with the most beers and completed_runs holds the widest beam that was searched to the end
+    """
+
+    # Like zero runs of the genetic algorithm, a beam of no paths searches nothing
+    if (beam_width == 0):
+        graph.finished = True
+        graph.completed_runs = 0
+        result = SearchResults()
+        result.reset()
+        return result
+
+    if (beam_width is not None or deadline is None):
+        beam_width = initial_width if (beam_width is None) else beam_width
+        result = graph.beam_search(beam_width, latitude, longitude, deadline=deadline)
+        graph.completed_runs = beam_width if (graph.finished) else 0
+        return result
+
+    best = None
+    completed_runs = 0
+    beam_width = initial_width
+    duration = 0
+
+    # The work of a beam grows with its width, so the next beam takes about twice as long as the last one
+    while (best is None or time.time() + 2 * duration < deadline):
+
+        beam_start = time.time()
+        result = graph.beam_search(beam_width, latitude, longitude, deadline=deadline)
+        duration = time.time() - beam_start
+
+        improved = best is None or len(result.beer) > len(best.beer)
+
+        if (improved):
+            best = result
+
+            if (progress is not None):
+                progress(result)
+
+        if (graph.finished):
+            completed_runs = beam_width
+
+            # A wider beam keeps the same paths if none were dropped for the width, and doesn't
+            # go on once doubling the width stops finding more beers
+            if (not graph.beam_truncated or not improved):
+                break
+
+        beam_width *= 2
+
+    graph.completed_runs = completed_runs
+
+    return best
+
+def search_paths(database_directory, maximum_distance, points, number_of_runs, seed=None, deadline=None):
+
+    """
+    Runs the genetic algorithm for a batch of start points inside of a worker process, the points share
+    the snapshot that is loaded once for the whole batch
+    Returns the result, the number of runs that were done before the deadline and whether the genetic
+    algorithm converged for every point
+
+    >>> graph = Graph('search_test.db')
+    >>> graph.reset()
+    >>> graph.nodes = [Brewery(brewery_id='1', beer=['a'], latitude=34, longitude=2),
+    ...     Brewery(brewery_id='2', beer=['b', 'c'], latitude=34, longitude=14)]
+    >>> graph.generate_graph()
+    >>> graph.store_graph()
+    >>> [([factory.brewery_id for factory in result.factories], completed_runs, converged)
+    ...     for result, completed_runs, converged in search_paths('search_test.db', 1000, [(35, 2), (35, 14)], 5, seed=1)]
+    [(['home', '1', 'home'], 5, False), (['home', '2', 'home'], 5, False)]
+    >>> graph.database._destroy()
+    """
+
+    graph = Graph(None, maximum_distance=maximum_distance, snapshot=load_snapshot(database_directory))
+
+    results = []
+
+    for latitude, longitude in points:
+        result = graph.genetic_near_neighbour(number_of_runs, latitude, longitude, seed=seed, deadline=deadline)
+        results.append((result, graph.completed_runs, graph.converged))
+
+    return results
+
+
+if __name__ == '__main__':
+
+    # Longest range the graph is built for, the API serves any range up to it from the same candidate rows
+    maximum_range = float(os.environ.get('MAXIMUM_RANGE', 1000))
+
+    # Largest graph that gets a distance matrix, it takes 4 * n * n bytes (400 MB for 10000 nodes)
+    maximum_matrix_nodes = int(os.environ.get('DISTANCE_MATRIX_MAXIMUM_NODES', 10000))
+
+    if (len(sys.argv) > 1 and sys.argv[1] == '-r'):
+        GraphDB('beer.db')._destroy()
+        graph = Graph('beer.db', maximum_distance=maximum_range)
+        graph.generate_and_store_graph()
+
+        # Binary copy of the graph and the distance matrix that the API workers memory map
+        snapshot = graph.generate_snapshot()
+        snapshot.write_file(graph_file_path('beer.db'))
+        snapshot.write_distance_file(distance_file_path('beer.db'), maximum_nodes=maximum_matrix_nodes)
+
+        # Shards of an earlier -s are split from the new graph with the same cells
+        shard_map = rebuild_shards(snapshot, 'beer.db', 2 * maximum_range, maximum_matrix_nodes)
+
+        if (shard_map is not None):
+            print('Rebuilt ' + str(len(shard_map.shards)) + ' shards')
+    elif (len(sys.argv) > 1 and sys.argv[1] == '-u'):
+        graph = Graph('beer.db', maximum_distance=maximum_range)
+        updated = graph.generate_and_update_graph()
+        print('Recomputed ' + str(len(updated)) + ' of ' + str(len(graph.nodes)) + ' nodes')
+
+        # Binary copy is rewritten from the updated database, it doesn't measure any distances
+        snapshot = GraphSnapshot()
+        snapshot.load_database('beer.db')
+        snapshot.write_file(graph_file_path('beer.db'))
+        snapshot.write_distance_file(distance_file_path('beer.db'), maximum_nodes=maximum_matrix_nodes)
+
+        # Shards of an earlier -s are split from the updated graph with the same cells
+        shard_map = rebuild_shards(snapshot, 'beer.db', 2 * maximum_range, maximum_matrix_nodes)
+
+        if (shard_map is not None):
+            print('Rebuilt ' + str(len(shard_map.shards)) + ' shards')
+    elif (len(sys.argv) > 1 and sys.argv[1] == '-s'):
+
+        # Shards of the graph for the backends that only load the cells they serve, the cell size is in degrees
+        shard_map = ShardMap(cell_size=int(sys.argv[2]) if len(sys.argv) > 2 else 30, halo=2 * maximum_range)
+        shard_map.build(load_snapshot('beer.db'), 'beer.db', maximum_matrix_nodes)
+        print('Wrote ' + str(len(shard_map.shards)) + ' shards')
     else:
         import doctest
         doctest.testmod()
@@ -0,0 +1,651 @@
+import mmap
+import os
+import struct
+from array import array
+
+import numpy
+from graphdb import GraphDB
+
+from connection import Connection
+from brewery import Brewery
+from spatial_index import SpatialIndex
+from haversine import distances_from_points
+from search_results import brewery_in_json
+
+# Snapshots that were already loaded, hashed by the database directory
+loaded_snapshots = {}
+
+# Header of the binary graph file: magic, byte order mark, node, edge, beer, node beer and string counts, size of the string data
+GRAPH_FILE_HEADER = struct.Struct('=8siqqqqqq')
+GRAPH_FILE_MAGIC = b'BEERGRF3'
+
+"""
+Read-only copy of the brewery graph held in memory, so the search doesn't
+have to fetch pickled objects from the database for every neighbour.
+Nodes are addressed by their position in brewery_ids and the adjacency is
+kept in compressed rows: the neighbours of node i are
+neighbours[offsets[i]:offsets[i + 1]] with the matching lengths.
+Rows are candidate lists sorted by distance, with the beer count of every
+neighbour and the highest beer count left in the row in parallel arrays,
+so the search can stop scanning once no candidate can beat the best one.
+Nodes are kept as arrays too, every beer name is stored once and the beers
+of node i are the ids beer_ids[beer_offsets[i]:beer_offsets[i + 1]].
+Coordinates are kept as doubles with a flag for the ones that were integers,
+so nodes and results show them as they were stored.
+The beers of every node are also kept as a bitmask of their ids, so the
+beers of a path are collected with a bitwise or and the new beers of a node
+are its distinct beers minus the popcount of the overlap.
+The distances between all of the nodes can be loaded from a float32 matrix
+file, which is memory mapped read-only so the processes share it
+"""
+class GraphSnapshot:
+
+    def __init__(self):
+        self.database_directory = None
+        self.brewery_ids = []
+        self.index = {}
+        self.names = []
+        self.beer_names = []
+        self.beer_index = {}
+        self.beer_offsets = array('l', [0])
+        self.beer_ids = array('i')
+        self.beer_counts = array('i')
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.integer_coordinates = array('b')
+        self.offsets = array('l', [0])
+        self.neighbours = array('i')
+        self.lengths = array('d')
+        self.candidate_beer_counts = array('i')
+        self.remaining_beer_counts = array('i')
+        self.beer_masks = []
+        self.distinct_beer_counts = array('i')
+        self.distances = None
+        self.fragments = []
+
+        self.spatial_index = SpatialIndex()
+
+        # Positions and brewery ids of the neighbours that weren't resolved to indexes yet
+        self.pending = []
+
+    def __len__(self):
+        return len(self.brewery_ids)
+
+    def name(self, index):
+        return self.names[index]
+
+    def beer_name(self, beer_id):
+        return self.beer_names[beer_id]
+
+    def number_of_beers(self):
+        return len(self.beer_names)
+
+    def node(self, index):
+
+        """
+        Returns a Brewery object of the node, it is created on every call
+        """
+
+        return Brewery(self.name(index), self.brewery_ids[index], self.beer(index), *self.coordinates(index))
+
+    def coordinates(self, index):
+
+        """
+        Returns the latitude and the longitude of the node, integers are returned as integers
+
+        >>> snapshot = GraphSnapshot()
+        >>> snapshot.add_node(Brewery(brewery_id='1', latitude=34, longitude=2.5))
+        >>> snapshot.coordinates(0)
+        (34, 2.5)
+        """
+
+        latitude = self.latitudes[index]
+        longitude = self.longitudes[index]
+
+        # First bit marks an integer latitude, the second bit an integer longitude
+        if (self.integer_coordinates[index] & 1):
+            latitude = int(latitude)
+
+        if (self.integer_coordinates[index] & 2):
+            longitude = int(longitude)
+
+        return latitude, longitude
+
+    def beer(self, index):
+
+        """
+        Returns the beer names of the node
+        """
+
+        return [self.beer_name(beer_id) for beer_id in self.beer_ids[self.beer_offsets[index]:self.beer_offsets[index + 1]]]
+
+    def add_node(self, node, candidates=None):
+
+        """
+        Appends a node and its candidate list to the snapshot, all of the candidates have to be added before lookups
+
+        >>> snapshot = GraphSnapshot()
+        >>> snapshot.add_node(Brewery(brewery_id='1', beer=['a', 'b'], latitude=34, longitude=2), (['3', '2'], [5.5, 12.5], [0, 1]))
+        >>> snapshot.add_node(Brewery(brewery_id='2', beer=['c'], latitude=34, longitude=14), (['1'], [12.5], [2]))
+        >>> snapshot.add_node(Brewery(brewery_id='3', latitude=34, longitude=2))
+        >>> snapshot.resolve()
+        >>> list(snapshot.beer_counts), list(snapshot.offsets), list(snapshot.neighbours), list(snapshot.lengths)
+        ([2, 1, 0], [0, 2, 3, 3], [2, 1, 0], [5.5, 12.5, 12.5])
+        >>> list(snapshot.candidate_beer_counts), list(snapshot.remaining_beer_counts)
+        ([0, 1, 2], [1, 1, 2])
+        >>> snapshot.beer_names, list(snapshot.beer_ids), snapshot.beer(1)
+        (['a', 'b', 'c'], [0, 1, 2], ['c'])
+        """
+
+        if (candidates is None):
+            candidates = ([], [], [])
+
+        brewery_ids, lengths, beer_counts = candidates
+
+        self.index[node.brewery_id] = len(self.brewery_ids)
+        self.brewery_ids.append(node.brewery_id)
+        self.names.append(node.name)
+        self.beer_counts.append(len(node.beer))
+
+        # Beer names get an id the first time they are seen
+        for beer_name in node.beer:
+
+            if (beer_name not in self.beer_index):
+                self.beer_index[beer_name] = len(self.beer_names)
+                self.beer_names.append(beer_name)
+
+            self.beer_ids.append(self.beer_index[beer_name])
+
+        self.beer_offsets.append(len(self.beer_ids))
+
+        self.latitudes.append(node.latitude)
+        self.longitudes.append(node.longitude)
+        self.integer_coordinates.append(isinstance(node.latitude, int) | isinstance(node.longitude, int) << 1)
+
+        # Brewery ids are kept until every node is known, then they are swapped for indexes
+        for brewery_id in brewery_ids:
+            self.pending.append((len(self.neighbours), brewery_id))
+            self.neighbours.append(-1)
+
+        self.lengths.extend(lengths)
+        self.candidate_beer_counts.extend(array('i', beer_counts))
+
+        # Highest beer count from each position to the end of the row
+        remaining = []
+        maximum = 0
+
+        for beer_count in reversed(beer_counts):
+            maximum = max(maximum, beer_count)
+            remaining.append(maximum)
+
+        self.remaining_beer_counts.extend(reversed(remaining))
+
+        self.offsets.append(len(self.lengths))
+
+    def resolve(self):
+
+        """
+        Replaces pending neighbour brewery ids with node indexes, indexes the node coordinates and builds the beer masks
+        """
+
+        for position, brewery_id in self.pending:
+            self.neighbours[position] = self.index[brewery_id]
+
+        self.pending = []
+
+        self.spatial_index = SpatialIndex(self.latitudes, self.longitudes)
+
+        self.sort_beers()
+        self.generate_beer_masks()
+        self.generate_fragments()
+
+    def sort_beers(self):
+
+        """
+        Renumbers the beers so the ones that most nodes have get the lowest ids, the overlap of two
+        beer masks is then made of low bits and stays a small number
+
+        >>> snapshot = GraphSnapshot()
+        >>> snapshot.add_node(Brewery(brewery_id='1', beer=['a', 'b'], latitude=34, longitude=2))
+        >>> snapshot.add_node(Brewery(brewery_id='2', beer=['c', 'b'], latitude=34, longitude=14))
+        >>> snapshot.sort_beers()
+        >>> snapshot.beer_names, list(snapshot.beer_ids), snapshot.beer(1)
+        (['b', 'a', 'c'], [1, 0, 2, 0], ['c', 'b'])
+        """
+
+        nodes_with_beer = [0] * len(self.beer_names)
+
+        for beer_id in self.beer_ids:
+            nodes_with_beer[beer_id] += 1
+
+        order = sorted(range(len(self.beer_names)), key=lambda beer_id: -nodes_with_beer[beer_id])
+
+        new_ids = [0] * len(order)
+
+        for new_id, beer_id in enumerate(order):
+            new_ids[beer_id] = new_id
+
+        self.beer_names = [self.beer_names[beer_id] for beer_id in order]
+        self.beer_index = {beer_name : beer_id for beer_id, beer_name in enumerate(self.beer_names)}
+        self.beer_ids = array('i', [new_ids[beer_id] for beer_id in self.beer_ids])
+
+    def generate_beer_masks(self):
+
+        """
+        Sets the bit of every beer id of a node in its beer mask and counts the bits
+
+        >>> snapshot = GraphSnapshot()
+        >>> snapshot.add_node(Brewery(brewery_id='1', beer=['a', 'b', 'a'], latitude=34, longitude=2))
+        >>> snapshot.add_node(Brewery(brewery_id='2', beer=['c', 'b'], latitude=34, longitude=14))
+        >>> snapshot.resolve()
+        >>> snapshot.beer_masks, list(snapshot.distinct_beer_counts), popcount(snapshot.beer_masks[0] | snapshot.beer_masks[1])
+        ([3, 6], [2, 2], 3)
+        """
+
+        self.beer_masks = []
+        self.distinct_beer_counts = array('i')
+
+        for index in range(len(self)):
+
+            mask = 0
+
+            for beer_id in self.beer_ids[self.beer_offsets[index]:self.beer_offsets[index + 1]]:
+                mask |= 1 << beer_id
+
+            self.beer_masks.append(mask)
+            self.distinct_beer_counts.append(popcount(mask))
+
+    def generate_fragments(self):
+
+        """
+        Encodes the json of every node once, results splice them together
+
+        >>> snapshot = GraphSnapshot()
+        >>> snapshot.add_node(Brewery('First', '1', ['a'], 34.5, 2.25))
+        >>> snapshot.resolve()
+        >>> snapshot.fragments
+        ['{"name": "First", "id": "1", "lat": 34.5, "long": 2.25}']
+        """
+
+        self.fragments = [brewery_in_json(self.name(index), self.brewery_ids[index], *self.coordinates(index))
+                for index in range(len(self))]
+
+    def load_database(self, database_directory):
+
+        """
+        Reads every node and its connections out of the database
+
+        >>> graph = Graph('test.db')
+        >>> graph.reset()
+        >>> graph.nodes = [Brewery(brewery_id='1', latitude=34, longitude=2),
+        ...     Brewery(brewery_id='2', latitude=34, longitude=14),
+        ...     Brewery(brewery_id='3', latitude=40, longitude=10)]
+        >>> graph.generate_graph()
+        >>> graph.store_graph()
+        >>> snapshot = GraphSnapshot()
+        >>> snapshot.load_database('test.db')
+        >>> snapshot.brewery_ids, list(snapshot.offsets), list(snapshot.neighbours)
+        (['1', '2', '3'], [0, 1, 2, 4], [2, 2, 1, 0])
+        >>> graph.database._destroy()
+        """
+
+        self.database_directory = database_directory
+
+        database = GraphDB(database_directory, autocommit=False)
+
+        brewery_ids = database('db').contains(list)
+
+        if (len(brewery_ids) == 0):
+            brewery_ids = []
+        else:
+            brewery_ids = brewery_ids[0]
+
+        nodes = [database(brewery_id).is_node(list)[0] for brewery_id in brewery_ids]
+        beer_counts = {node.brewery_id : len(node.beer) for node in nodes}
+
+        for node in nodes:
+
+            candidates = database(node.brewery_id).candidates(list)
+
+            # Databases built before the candidate lists were stored only have the connections
+            if (len(candidates) > 0):
+                candidates = candidates[0]
+            else:
+                candidates = sort_candidates(database(node.brewery_id).connects(list)[0], beer_counts)
+
+            self.add_node(node, candidates)
+
+        self.resolve()
+
+        database.close()
+
+    def subset(self, indexes):
+
+        """
+        Returns a new snapshot of the nodes at the indexes, in the same order, with their rows
+        reduced to the neighbours that are part of the subset
+
+        >>> snapshot = GraphSnapshot()
+        >>> snapshot.add_node(Brewery(brewery_id='1', beer=['a', 'b'], latitude=34, longitude=2), (['3', '2'], [5.5, 12.5], [0, 1]))
+        >>> snapshot.add_node(Brewery(brewery_id='2', beer=['c'], latitude=34, longitude=14), (['1'], [12.5], [2]))
+        >>> snapshot.add_node(Brewery(brewery_id='3', latitude=34, longitude=2))
+        >>> snapshot.resolve()
+        >>> subset = snapshot.subset([0, 2])
+        >>> subset.brewery_ids, list(subset.offsets), list(subset.neighbours), list(subset.lengths), subset.beer(0)
+        (['1', '3'], [0, 1, 1], [1], [5.5], ['a', 'b'])
+        """
+
+        included = set(indexes)
+
+        subset = GraphSnapshot()
+
+        for index in indexes:
+            row = [position for position in range(self.offsets[index], self.offsets[index + 1]) if self.neighbours[position] in included]
+
+            subset.add_node(self.node(index), ([self.brewery_ids[self.neighbours[position]] for position in row],
+                    [self.lengths[position] for position in row], [self.candidate_beer_counts[position] for position in row]))
+
+        subset.resolve()
+
+        return subset
+
+    def write_file(self, path):
+
+        """
+        Writes the snapshot into a compact binary file, which MappedGraphSnapshot memory maps
+        Sections are the candidate rows (offsets, int32 neighbours, float32 lengths, int32 beer counts),
+        the node arrays, the beer ids of the nodes and a string table holding the id and the name
+        of every node followed by the beer names
+
+        >>> snapshot = GraphSnapshot()
+        >>> snapshot.add_node(Brewery('First', '1', ['a', 'b'], 34.5, 2.25), (['2'], [12.5], [1]))
+        >>> snapshot.add_node(Brewery('Second', '2', ['b'], 34, 2.5), (['1'], [12.5], [2]))
+        >>> snapshot.resolve()
+        >>> snapshot.write_file('test.graph')
+        >>> mapped = MappedGraphSnapshot()
+        >>> mapped.load_file('test.graph')
+        >>> mapped.brewery_ids, list(mapped.offsets), list(mapped.neighbours), list(mapped.lengths)
+        (['1', '2'], [0, 1, 2], [1, 0], [12.5, 12.5])
+        >>> list(mapped.candidate_beer_counts), list(mapped.beer_counts), list(mapped.beer_ids), mapped.beer(0)
+        ([1, 2], [2, 1], [1, 0, 0], ['a', 'b'])
+        >>> mapped.node(1).attributes()
+        {'beer': ['b'], 'latitude': 34, 'longitude': 2.5, 'name': 'Second', 'brewery_id': '2'}
+        >>> mapped.close()
+        >>> os.remove('test.graph')
+        """
+
+        # Every node has its id and its name in the string table, the beer names follow them
+        strings = []
+
+        for index in range(len(self)):
+            strings.extend([self.brewery_ids[index], self.name(index)])
+
+        strings.extend(self.beer_name(beer_id) for beer_id in range(self.number_of_beers()))
+
+        encoded = [string.encode('utf8') for string in strings]
+
+        string_offsets = array('q', [0])
+
+        for string in encoded:
+            string_offsets.append(string_offsets[-1] + len(string))
+
+        blob = b''.join(encoded)
+
+        sections = [array('q', self.offsets), array('i', self.neighbours), array('f', self.lengths),
+                array('i', self.candidate_beer_counts), array('i', self.remaining_beer_counts),
+                array('i', self.beer_counts), array('d', self.latitudes), array('d', self.longitudes), array('b', self.integer_coordinates),
+                array('q', self.beer_offsets), array('i', self.beer_ids), string_offsets]
+
+        with open(path, 'wb') as graph_file:
+
+            graph_file.write(GRAPH_FILE_HEADER.pack(GRAPH_FILE_MAGIC, 1, len(self), len(self.neighbours), self.number_of_beers(),
+                    len(self.beer_ids), len(strings), len(blob)))
+
+            # Sections are padded to 8 bytes so every array is aligned
+            for section in sections + [blob]:
+                data = section if isinstance(section, bytes) else section.tobytes()
+                graph_file.write(data)
+                graph_file.write(b'\0' * (-len(data) % 8))
+
+    def write_distance_file(self, path, block_size=1024, maximum_nodes=None):
+
+        """
+        Writes the distances between all of the nodes into a float32 matrix in the .npy format,
+        the rows are calculated in blocks so only the file holds the whole matrix. The matrix takes
+        4 * n * n bytes, so a graph with more than maximum_nodes nodes doesn't get one and an older
+        matrix at the path is removed, its distances are calculated. Returns whether the matrix was written
+
+        >>> snapshot = GraphSnapshot()
+        >>> snapshot.add_node(Brewery(brewery_id='1', latitude=34, longitude=2))
+        >>> snapshot.add_node(Brewery(brewery_id='2', latitude=34, longitude=14))
+        >>> snapshot.add_node(Brewery(brewery_id='3', latitude=40, longitude=10))
+        >>> snapshot.resolve()
+        >>> snapshot.write_distance_file('test.distances.npy', block_size=2)
+        True
+        >>> snapshot.load_distance_file('test.distances.npy')
+        >>> snapshot.pair_distances([0, 2], [1, 2])
+        array([[1105.583,  973.8  ],
+               [ 755.621,    0.   ]])
+        >>> snapshot.distances = None
+        >>> snapshot.write_distance_file('test.distances.npy', maximum_nodes=2), os.path.isfile('test.distances.npy')
+        (False, False)
+        """
+
+        if (maximum_nodes is not None and len(self) > maximum_nodes):
+
+            # A matrix of an older version of the graph wouldn't match it anymore
+            if (os.path.isfile(path)):
+                os.remove(path)
+
+            return False
+
+        distances = numpy.lib.format.open_memmap(path, mode='w+', dtype=numpy.float32, shape=(len(self), len(self)))
+
+        for start in range(0, len(self), block_size):
+            end = min(start + block_size, len(self))
+            distances[start:end] = distances_from_points(self.latitudes[start:end], self.longitudes[start:end], self.latitudes, self.longitudes)
+
+        distances.flush()
+
+        del distances
+
+        return True
+
+    def load_distance_file(self, path):
+
+        distances = numpy.load(path, mmap_mode='r')
+
+        if (distances.shape != (len(self), len(self))):
+            raise ValueError('Distance matrix doesn\'t match the graph: ' + path)
+
+        self.distances = distances
+
+    def pair_distances(self, rows, columns):
+
+        """
+        Returns the distances from the row nodes to the column nodes, they are read from the distance matrix if
+        it is loaded and rounding restores the calculated distances, otherwise they are calculated
+
+        >>> snapshot = GraphSnapshot()
+        >>> snapshot.add_node(Brewery(brewery_id='1', latitude=34, longitude=2))
+        >>> snapshot.add_node(Brewery(brewery_id='2', latitude=34, longitude=14))
+        >>> snapshot.resolve()
+        >>> snapshot.pair_distances([1], [0, 1])
+        array([[1105.583,    0.   ]])
+        """
+
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        columns = numpy.asarray(columns, dtype=numpy.int64)
+
+        if (self.distances is not None):
+            return numpy.round(self.distances[rows[:, None], columns[None, :]].astype(numpy.float64), 3)
+
+        latitudes = numpy.asarray(self.latitudes)
+        longitudes = numpy.asarray(self.longitudes)
+
+        return distances_from_points(latitudes[rows], longitudes[rows], latitudes[columns], longitudes[columns])
+
+"""
+Snapshot read from the binary graph file through a read-only memory map, so
+loading it doesn't unpickle anything and all of the processes mapping the
+same file share its pages. Names are only decoded for the nodes that end up
+in a result
+"""
+class MappedGraphSnapshot(GraphSnapshot):
+
+    def load_file(self, path):
+
+        graph_file = open(path, 'rb')
+        self.memory_map = mmap.mmap(graph_file.fileno(), 0, access=mmap.ACCESS_READ)
+        graph_file.close()
+
+        magic, byte_order, node_count, edge_count, beer_count, beer_id_count, string_count, blob_size = GRAPH_FILE_HEADER.unpack_from(self.memory_map)
+
+        if (magic != GRAPH_FILE_MAGIC or byte_order != 1):
+            raise ValueError('Not a graph file of this version and platform: ' + path)
+
+        view = memoryview(self.memory_map)
+        position = GRAPH_FILE_HEADER.size
+
+        def section(item_format, count):
+            nonlocal position
+            size = struct.calcsize(item_format) * count
+            data = view[position:position + size]
+            position += size + (-size % 8)
+            return data.cast(item_format)
+
+        self.offsets = section('q', node_count + 1)
+        self.neighbours = section('i', edge_count)
+        self.lengths = section('f', edge_count)
+        self.candidate_beer_counts = section('i', edge_count)
+        self.remaining_beer_counts = section('i', edge_count)
+        self.beer_counts = section('i', node_count)
+        self.latitudes = section('d', node_count)
+        self.longitudes = section('d', node_count)
+        self.integer_coordinates = section('b', node_count)
+        self.beer_offsets = section('q', node_count + 1)
+        self.beer_ids = section('i', beer_id_count)
+        self.string_offsets = section('q', string_count + 1)
+        self.strings = section('B', blob_size)
+
+        self.beer_count = beer_count
+        self.brewery_ids = [self.string(2 * index) for index in range(node_count)]
+        self.index = {brewery_id : index for index, brewery_id in enumerate(self.brewery_ids)}
+
+        self.spatial_index = SpatialIndex(self.latitudes, self.longitudes)
+
+        self.generate_beer_masks()
+        self.generate_fragments()
+
+    def close(self):
+
+        # Views have to be released before the memory map can be closed
+        for name in ['offsets', 'neighbours', 'lengths', 'candidate_beer_counts', 'remaining_beer_counts', 'beer_counts',
+                'latitudes', 'longitudes', 'integer_coordinates', 'beer_offsets', 'beer_ids', 'string_offsets', 'strings']:
+            getattr(self, name).release()
+
+        self.spatial_index = SpatialIndex()
+        self.memory_map.close()
+
+    def string(self, position):
+        return bytes(self.strings[self.string_offsets[position]:self.string_offsets[position + 1]]).decode('utf8')
+
+    def name(self, index):
+        return self.string(2 * index + 1)
+
+    def beer_name(self, beer_id):
+        return self.string(2 * len(self.brewery_ids) + beer_id)
+
+    def number_of_beers(self):
+        return self.beer_count
+
+def graph_file_path(database_directory):
+
+    """
+    Returns the path of the binary graph file that belongs to the database
+
+    >>> graph_file_path('beer.db')
+    'beer.graph'
+    """
+
+    return os.path.splitext(database_directory)[0] + '.graph'
+
+def distance_file_path(database_directory):
+
+    """
+    Returns the path of the distance matrix file that belongs to the database
+
+    >>> distance_file_path('beer.db')
+    'beer.distances.npy'
+    """
+
+    return os.path.splitext(database_directory)[0] + '.distances.npy'
+
+def sort_candidates(connections, beer_counts):
+
+    """
+    Sorts the connections by distance into parallel arrays of brewery ids, lengths and beer counts
+
+    >>> sort_candidates([Connection('1', 20.5), Connection('2', 3.25), Connection('3', 20.5)], {'1' : 4, '2' : 0, '3' : 1})
+    (['2', '1', '3'], array('d', [3.25, 20.5, 20.5]), array('l', [0, 4, 1]))
+    """
+
+    connections = sorted(connections, key=lambda connection: connection.length)
+
+    return ([connection.brewery_id for connection in connections],
+            array('d', [connection.length for connection in connections]),
+            array('l', [beer_counts[connection.brewery_id] for connection in connections]))
+
+def popcount(mask):
+
+    """
+    Counts the bits set in the mask, int.bit_count needs python 3.10
+
+    >>> popcount(0b101101)
+    4
+    """
+
+    return bin(mask).count('1')
+
+def load_snapshot(database_directory):
+
+    """
+    Returns the snapshot of the database, it is only read once per process
+    The binary graph file is memory mapped if it was generated, otherwise the database is read.
+    Without either of them there is no graph, opening the database would create an empty one
+
+    >>> load_snapshot('missing.db')
+    Traceback (most recent call last):
+    FileNotFoundError: No graph file or database: missing.db
+    """
+
+    if (database_directory not in loaded_snapshots):
+
+        if (os.path.isfile(graph_file_path(database_directory))):
+            snapshot = MappedGraphSnapshot()
+            snapshot.load_file(graph_file_path(database_directory))
+        elif (os.path.isfile(database_directory)):
+            snapshot = GraphSnapshot()
+            snapshot.load_database(database_directory)
+        else:
+            raise FileNotFoundError('No graph file or database: ' + database_directory)
+
+        # Distance matrix is optional, without it the distances are calculated
+        if (os.path.isfile(distance_file_path(database_directory))):
+            snapshot.load_distance_file(distance_file_path(database_directory))
+
+        snapshot.database_directory = database_directory
+        loaded_snapshots[database_directory] = snapshot
+
+    return loaded_snapshots[database_directory]
+
+def load_snapshots(*database_directories):
+
+    # Backends serving several shards load all of them up front
+    for database_directory in database_directories:
+        load_snapshot(database_directory)
+
+if __name__ == '__main__':
+    import doctest
+    from graph import Graph
+    doctest.testmod()
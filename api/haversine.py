@@ -0,0 +1,68 @@
+import numpy
+
+# earth's mean radius
+EARTH_RADIUS = 6371
+
+"""
+Batched versions of Graph.calculate_distance, they apply the same harvesine
+formula and rounding to whole arrays of coordinates at once
+"""
+
+def haversine(latitudes_1, longitudes_1, latitudes_2, longitudes_2):
+
+    """
+    Calculates the distances between two sets of coordinates, the arrays are broadcast against each other
+
+    >>> haversine(numpy.array([51, 34]), numpy.array([12, 2]), 58, numpy.array([3, 10]))
+    array([ 969.648, 2734.877])
+    """
+
+    latitudes_1 = numpy.asarray(latitudes_1, dtype=numpy.float64)
+    longitudes_1 = numpy.asarray(longitudes_1, dtype=numpy.float64)
+    latitudes_2 = numpy.asarray(latitudes_2, dtype=numpy.float64)
+    longitudes_2 = numpy.asarray(longitudes_2, dtype=numpy.float64)
+
+    # Calculate distance between latitudes and longitutdes
+    latitude_distance = numpy.radians(latitudes_2 - latitudes_1)
+    longitude_distance = numpy.radians(longitudes_2 - longitudes_1)
+
+    # Apply harvesine formula
+    a = (numpy.sin(latitude_distance / 2) ** 2 +
+         numpy.sin(longitude_distance / 2) ** 2 *
+             numpy.cos(numpy.radians(latitudes_1)) * numpy.cos(numpy.radians(latitudes_2)))
+
+    c = 2 * numpy.arcsin(numpy.sqrt(a))
+
+    return numpy.round(EARTH_RADIUS * c, 3)
+
+def distances_from(latitude, longitude, latitudes, longitudes):
+
+    """
+    Calculates the distances from every coordinate in the arrays to a single coordinate
+
+    >>> distances_from(58, 3, [51, 58], [12, 3])
+    array([969.648,   0.   ])
+    """
+
+    return haversine(latitudes, longitudes, latitude, longitude)
+
+def distances_from_points(latitude_points, longitude_points, latitudes, longitudes):
+
+    """
+    Calculates the distances from every coordinate in the arrays to every point, one row per point
+
+    >>> distances_from_points([58, 34], [3, 2], [51, 58], [12, 3])
+    array([[ 969.648,    0.   ],
+           [2056.005, 2669.726]])
+    """
+
+    latitude_points = numpy.asarray(latitude_points, dtype=numpy.float64)
+    longitude_points = numpy.asarray(longitude_points, dtype=numpy.float64)
+    latitudes = numpy.asarray(latitudes, dtype=numpy.float64)
+    longitudes = numpy.asarray(longitudes, dtype=numpy.float64)
+
+    return haversine(latitudes[None, :], longitudes[None, :], latitude_points[:, None], longitude_points[:, None])
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
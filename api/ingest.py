@@ -0,0 +1,93 @@
+import csv
+import os
+
+from brewery import Brewery
+
+"""
+Streams the breweries out of the csv files, every file is read once row by
+row and only the coordinates and beer names of the breweries are kept in
+memory until the brewery rows are joined with them
+"""
+
+def read_rows(path):
+
+    """
+    Yields the rows of a csv file one at a time
+    """
+
+    with open(path, encoding='utf8') as data:
+        for row in csv.reader(data, delimiter=','):
+            yield row
+
+def read_coordinates(rows):
+
+    """
+    Hashes the latitude and longitude of the rows by brewery id
+
+    >>> read_coordinates([['1', '7', '51.2', '14.1'], ['2', '8']])
+    {'7': ('51.2', '14.1')}
+    """
+
+    coordinates = {}
+
+    for row in rows:
+
+        # Check if no data is missing
+        if (len(row) >= 4):
+            coordinates[row[1]] = (row[2], row[3])
+
+    return coordinates
+
+def read_beers(rows, coordinates):
+
+    """
+    Hashes the beer names of the rows by brewery id, beers of breweries without coordinates are skipped
+
+    >>> read_beers([['1', '7', 'Lager'], ['2', '8', 'Stout'], ['3', '7', 'Porter']], {'7' : ('51.2', '14.1')})
+    {'7': ['Lager', 'Porter']}
+    """
+
+    beers = {}
+
+    for row in rows:
+
+        # Check if no data is missing and the brewery has coordinates
+        if (len(row) >= 3 and row[1] in coordinates):
+            beers.setdefault(row[1], []).append(row[2])
+
+    return beers
+
+def join_breweries(rows, coordinates, beers):
+
+    """
+    Yields a Brewery object for every brewery row that has coordinates
+
+    >>> breweries = join_breweries([['7', 'First'], ['8', 'Second'], ['9', 'Third']],
+    ...     {'7' : ('51.2', '14.1'), '9' : ('', '')}, {'7' : ['Lager']})
+    >>> [brewery.attributes() for brewery in breweries]
+    [{'beer': ['Lager'], 'latitude': 51.2, 'longitude': 14.1, 'name': 'First', 'brewery_id': '7'}]
+    """
+
+    for row in rows:
+
+        # Check if no data is missing and latitude is set
+        if (len(row) >= 2 and row[0] in coordinates and coordinates[row[0]][0] != ""):
+
+            latitude, longitude = coordinates[row[0]]
+
+            yield Brewery(row[1], row[0], beers.get(row[0], []), float(latitude), float(longitude))
+
+def stream_breweries(data_directory='./data'):
+
+    """
+    Yields the breweries of the csv files in the data directory
+    """
+
+    coordinates = read_coordinates(read_rows(os.path.join(data_directory, 'geocodes.csv')))
+    beers = read_beers(read_rows(os.path.join(data_directory, 'beers.csv')), coordinates)
+
+    return join_breweries(read_rows(os.path.join(data_directory, 'breweries.csv')), coordinates, beers)
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,111 @@
+import time
+
+"""
+Counters and stage timers of the path finding. A Graph only records into
+its metrics when it has them, so searches without instrumentation only pay
+for a check at the end of each stage. The metrics of the requests are
+merged into the totals of the process, which are served in the Prometheus
+text format
+"""
+class Metrics:
+
+    def __init__(self):
+        self.counters = {}
+        self.seconds = {}
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_time(self, stage, start):
+
+        """
+        Adds the time since start (a time.perf_counter() value) to the stage
+        """
+
+        self.seconds[stage] = self.seconds.get(stage, 0) + time.perf_counter() - start
+
+    def merge(self, other):
+
+        """
+        Adds the counters and the times of the other metrics
+
+        >>> metrics = Metrics()
+        >>> metrics.count('hops', 3)
+        >>> other = Metrics()
+        >>> other.count('hops')
+        >>> other.count('database_fetches', 2)
+        >>> metrics.merge(other)
+        >>> metrics.counters
+        {'hops': 4, 'database_fetches': 2}
+        """
+
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+
+        for stage, seconds in other.seconds.items():
+            self.seconds[stage] = self.seconds.get(stage, 0) + seconds
+
+    def as_dict(self):
+
+        """
+        Returns the counters and the stage times in milliseconds
+
+        >>> metrics = Metrics()
+        >>> metrics.count('hops', 3)
+        >>> metrics.seconds['search'] = 0.0123456
+        >>> metrics.as_dict()
+        {'counters': {'hops': 3}, 'milliseconds': {'search': 12.346}}
+        """
+
+        return {
+            'counters' : dict(self.counters),
+            'milliseconds' : {stage : round(seconds * 1000, 3) for stage, seconds in self.seconds.items()}
+        }
+
+    def timing_header(self):
+
+        """
+        Returns the stage times in the format of the Server-Timing header
+
+        >>> metrics = Metrics()
+        >>> metrics.seconds['insert_home'] = 0.0005
+        >>> metrics.seconds['search'] = 0.25
+        >>> metrics.timing_header()
+        'insert_home;dur=0.5, search;dur=250.0'
+        """
+
+        return ', '.join(stage + ';dur=' + str(round(seconds * 1000, 3)) for stage, seconds in self.seconds.items())
+
+    def prometheus(self, prefix='beer_'):
+
+        """
+        Returns the metrics in the Prometheus text format, counters are totals and the stage times are
+        the seconds spent in each stage
+
+        >>> metrics = Metrics()
+        >>> metrics.count('requests', 2)
+        >>> metrics.seconds['search'] = 1.5
+        >>> print(metrics.prometheus())
+        # TYPE beer_requests_total counter
+        beer_requests_total 2
+        # TYPE beer_stage_seconds_total counter
+        beer_stage_seconds_total{stage="search"} 1.5
+        """
+
+        lines = []
+
+        for name in sorted(self.counters):
+            lines.append('# TYPE ' + prefix + name + '_total counter')
+            lines.append(prefix + name + '_total ' + str(self.counters[name]))
+
+        if (len(self.seconds) > 0):
+            lines.append('# TYPE ' + prefix + 'stage_seconds_total counter')
+
+        for stage in sorted(self.seconds):
+            lines.append(prefix + 'stage_seconds_total{stage="' + stage + '"} ' + repr(round(self.seconds[stage], 6)))
+
+        return '\n'.join(lines)
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,206 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+"""
+Caches the json of the search results by the quantized start coordinates,
+so repeated queries from the same place don't run the search again.
+The least recently used results are evicted when the cache is full and
+results older than the time to live are treated as missing. A result can
+be stored with its compressed json, so hits don't compress it again. The cache is
+shared by the threads of the uWSGI worker, so every access holds its lock
+"""
+class ResultCache:
+
+    def __init__(self, maximum_size=1024, time_to_live=3600, quantization=0.01):
+        self.maximum_size = maximum_size
+        self.time_to_live = time_to_live
+        self.quantization = quantization
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def key(self, latitude, longitude, *parameters):
+
+        """
+        Builds the cache key, coordinates are snapped to the quantization grid
+
+        >>> cache = ResultCache(quantization=0.5)
+        >>> cache.key(51.1, 14.3, 20, None)
+        '102|29|20|None'
+        >>> cache.key(51.0, 14.4, 20, None) == cache.key(51.1, 14.3, 20, None)
+        True
+        """
+
+        return '|'.join([str(round(latitude / self.quantization)), str(round(longitude / self.quantization))] +
+                [str(parameter) for parameter in parameters])
+
+    def get(self, key):
+
+        """
+        Returns the cached json or None if it isn't cached
+
+        >>> cache = ResultCache(maximum_size=2)
+        >>> cache.put('a', '1')
+        >>> cache.put('b', '2')
+        >>> cache.get('a')
+        '1'
+        >>> cache.put('c', '3')
+        >>> cache.get('b') is None, cache.get('a'), cache.get('c')
+        (True, '1', '3')
+        >>> cache.stats()
+        {'hits': 3, 'misses': 1, 'size': 2}
+        """
+
+        entry = self.get_entry(key)
+
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key):
+
+        """
+        Returns the cached json and its compressed json, which is None if it wasn't stored, or None if it isn't cached
+
+        >>> cache = ResultCache()
+        >>> cache.put('a', '1', b'compressed')
+        >>> cache.put('b', '2')
+        >>> cache.get_entry('a'), cache.get_entry('b'), cache.get_entry('c')
+        (('1', b'compressed'), ('2', None), None)
+        """
+
+        with self.lock:
+
+            entry = self.lookup(key)
+
+            self.count('misses' if entry is None else 'hits')
+
+            return entry
+
+    def count(self, counter):
+        setattr(self, counter, getattr(self, counter) + 1)
+
+    def lookup(self, key):
+
+        if (key not in self.results):
+            return None
+
+        created, value, compressed = self.results[key]
+
+        # Expired results are removed
+        if (self.time_to_live is not None and time.time() - created > self.time_to_live):
+            del self.results[key]
+            return None
+
+        # Mark as the most recently used
+        self.results.move_to_end(key)
+
+        return value, compressed
+
+    def put(self, key, value, compressed=None):
+
+        with self.lock:
+            self.store(key, value, compressed)
+
+    def store(self, key, value, compressed=None):
+
+        self.results[key] = (time.time(), value, compressed)
+        self.results.move_to_end(key)
+
+        # Evict least recently used results
+        while (len(self.results) > self.maximum_size):
+            self.results.popitem(last=False)
+
+    def size(self):
+        return len(self.results)
+
+    def stats(self):
+
+        with self.lock:
+            return {'hits' : self.hits, 'misses' : self.misses, 'size' : self.size()}
+
+    def stats_in_json(self):
+        return json.dumps(self.stats())
+
+"""
+Result cache stored in a SQLite file, so all of the uWSGI workers share the
+cached results. Hits don't write to the file, the hit and miss counters are
+kept by every worker and the last use of a result is only rewritten once it
+is older than a tenth of the time to live, which is precise enough for the
+eviction of the least recently used results
+"""
+class SqliteResultCache(ResultCache):
+
+    def __init__(self, path, maximum_size=1024, time_to_live=3600, quantization=0.01):
+        super().__init__(maximum_size, time_to_live, quantization)
+
+        # Seconds a last use stays current
+        self.use_interval = 60 if time_to_live is None else time_to_live / 10
+
+        self.connection = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+
+        # Readers don't block the writer and commits don't wait for the disk
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, created REAL, used REAL, compressed BLOB)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+
+    def lookup(self, key):
+
+        """
+        Returns the cached value, the last use is only written when it is older than the use interval
+
+        >>> cache = SqliteResultCache(':memory:', maximum_size=2)
+        >>> cache.put('a', '1')
+        >>> cache.put('b', '2')
+        >>> used = cache.connection.execute("SELECT used FROM results WHERE key = 'a'").fetchone()[0]
+        >>> cache.get('a'), cache.connection.execute("SELECT used FROM results WHERE key = 'a'").fetchone()[0] == used
+        ('1', True)
+        >>> cache.use_interval = 0
+        >>> cache.get('a')
+        '1'
+        >>> cache.put('c', '3')
+        >>> cache.get('b') is None, cache.get('a'), cache.get('c')
+        (True, '1', '3')
+        >>> cache.stats()
+        {'hits': 4, 'misses': 1, 'size': 2}
+        >>> cache.put('d', '4', b'compressed')
+        >>> cache.get_entry('d')
+        ('4', b'compressed')
+        """
+
+        row = self.connection.execute('SELECT value, compressed, created, used FROM results WHERE key = ?', (key,)).fetchone()
+
+        if (row is None):
+            return None
+
+        value, compressed, created, used = row
+
+        # Expired results are removed
+        if (self.time_to_live is not None and time.time() - created > self.time_to_live):
+            self.connection.execute('DELETE FROM results WHERE key = ?', (key,))
+            return None
+
+        # Mark as the most recently used, a recent use is left as it is
+        if (time.time_ns() - used > self.use_interval * 1e9):
+            self.connection.execute('UPDATE results SET used = ? WHERE key = ?', (time.time_ns(), key))
+
+        return value, compressed
+
+    def store(self, key, value, compressed=None):
+
+        self.connection.execute('INSERT OR REPLACE INTO results (key, value, created, used, compressed) VALUES (?, ?, ?, ?, ?)',
+                (key, value, time.time(), time.time_ns(), compressed))
+
+        # Evict least recently used results
+        self.connection.execute('DELETE FROM results WHERE key NOT IN (SELECT key FROM results ORDER BY used DESC LIMIT ?)', (self.maximum_size,))
+
+    def size(self):
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,124 @@
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+"""
+Bounded executor for the searches of a uWSGI worker. Jobs wait in a queue
+with a size limit and are handed to the process pool only when one of its
+processes is free, so the queue can be ordered: jobs with the lowest cost
+run first and a cheap request doesn't wait behind expensive ones that were
+queued before it. A job that is cancelled while it waits never runs
+"""
+class SearchExecutor:
+
+    def __init__(self, workers=1, queue_size=16, initializer=None, initargs=()):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+        self.jobs = []
+        self.order = itertools.count()
+        self.free_workers = threading.Semaphore(workers)
+        self.condition = threading.Condition()
+        self.running = True
+
+        self.dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, function, *args, cost=0):
+
+        """
+        Queues the job and returns its future, raises SearchQueueFull if the queue holds queue_size jobs
+
+        >>> executor = SearchExecutor(workers=1, queue_size=1)
+        >>> executor.submit(pow, 2, 10).result(timeout=30)
+        1024
+        >>> executor.shutdown()
+        """
+
+        future = Future()
+
+        with self.condition:
+
+            # Cancelled jobs don't count towards the limit
+            self.jobs = [job for job in self.jobs if not job[3].cancelled()]
+            heapq.heapify(self.jobs)
+
+            if (len(self.jobs) >= self.queue_size):
+                raise SearchQueueFull()
+
+            heapq.heappush(self.jobs, (cost, next(self.order), (function, args), future))
+            self.condition.notify()
+
+        return future
+
+    def queued(self):
+        with self.condition:
+            return len(self.jobs)
+
+    def dispatch(self):
+
+        """
+        Hands the cheapest queued job to the pool whenever one of its processes is free
+        """
+
+        while True:
+
+            self.free_workers.acquire()
+
+            with self.condition:
+
+                while (self.running and len(self.jobs) == 0):
+                    self.condition.wait()
+
+                if (not self.running):
+                    return
+
+                cost, order, (function, args), future = heapq.heappop(self.jobs)
+
+            # Skip jobs whose caller stopped waiting for them
+            if (not future.set_running_or_notify_cancel()):
+                self.free_workers.release()
+                continue
+
+            try:
+                pool_future = self.pool.submit(function, *args)
+            except Exception as error:
+                future.set_exception(error)
+                self.free_workers.release()
+                continue
+
+            pool_future.add_done_callback(lambda pool_future, future=future: self.finish(pool_future, future))
+
+    def finish(self, pool_future, future):
+
+        self.free_workers.release()
+
+        if (pool_future.exception() is not None):
+            future.set_exception(pool_future.exception())
+        else:
+            future.set_result(pool_future.result())
+
+    def shutdown(self):
+
+        with self.condition:
+            self.running = False
+
+            for job in self.jobs:
+                job[3].cancel()
+
+            self.jobs = []
+            self.condition.notify_all()
+
+        self.free_workers.release()
+        self.pool.shutdown()
+
+"""
+Raised when the queue of the search executor is full
+"""
+class SearchQueueFull(Exception):
+    pass
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -5,11 +5,14 @@ Stores search results
 """
 class SearchResults:
 
-    def __init__(self, factories=[], beer=set(), distance=[0]):
+    def __init__(self, factories=[], beer=set(), distance=[0], fragments=None):
         self.factories = factories
         self.beer = beer
         self.distance = distance
 
+        # Json of the factories, precomputed by the snapshot, None if they have to be encoded
+        self.fragments = fragments
+
     def reset(self):
 
         """
@@ -26,31 +29,39 @@ class SearchResults:
         self.factories = []
         self.beer = set()
         self.distance = [0]
+        self.fragments = None
 
-    def return_in_json(self):
+    def return_in_json(self, metadata=None):
 
         """
-        Returns data in json format
+        Returns data in json format, the fields of the metadata are appended after the result
+        The json of the factories is spliced in from the fragments if they are known
 
         >>> result = SearchResults([Brewery('test_1', '1', ['test_1_beer'], 51, 14), Brewery('test_2', '2', ['test_2_beer'], 43, 5)], 
         ... ['test_1_beer', 'test_2_beer'], 
         ... [12, 34])
         >>> result.return_in_json()
         '{"breweries": [{"name": "test_1", "id": "1", "lat": 51, "long": 14}, {"name": "test_2", "id": "2", "lat": 43, "long": 5}], "beer": ["test_1_beer", "test_2_beer"], "distance": [12, 34]}'
+        >>> SearchResults([], [], [0]).return_in_json({'partial' : True})
+        '{"breweries": [], "beer": [], "distance": [0], "partial": true}'
+        >>> SearchResults([Brewery('test_1', '1', [], 51, 14)], [], [0], ['{"name": "cached"}']).return_in_json()
+        '{"breweries": [{"name": "cached"}], "beer": [], "distance": [0]}'
         """
 
-        results = {'breweries' : [], 'beer' : list(self.beer), 'distance' : self.distance}
+        if (self.fragments is not None):
+            breweries = self.fragments
+        else:
+            breweries = [brewery_in_json(factory.name, factory.brewery_id, factory.latitude, factory.longitude) for factory in self.factories]
+
+        parts = ['{"breweries": [', ', '.join(breweries), '], "beer": ', json.dumps(list(self.beer)), ', "distance": ', json.dumps(self.distance)]
 
-        for factory in self.factories:
+        if (metadata is not None):
+            for key, value in metadata.items():
+                parts.extend([', ', json.dumps(key), ': ', json.dumps(value)])
 
-            results['breweries'].append({
-                    'name' : factory.name,
-                    'id' : factory.brewery_id,
-                    'lat' : factory.latitude,
-                    'long' : factory.longitude
-                })
+        parts.append('}')
 
-        return json.dumps(results)
+        return ''.join(parts)
 
     def display_results(self):
 
@@ -72,6 +83,17 @@ class SearchResults:
         for drink in self.beer:
             print(drink)
 
+def brewery_in_json(name, brewery_id, latitude, longitude):
+
+    """
+    Returns the json of a brewery in a result
+
+    >>> brewery_in_json('test_1', '1', 51.5, 14)
+    '{"name": "test_1", "id": "1", "lat": 51.5, "long": 14}'
+    """
+
+    return json.dumps({'name' : name, 'id' : brewery_id, 'lat' : latitude, 'long' : longitude})
+
 if __name__ == '__main__':
     import doctest
     from brewery import Brewery
@@ -0,0 +1,200 @@
+import json
+import math
+import os
+
+import numpy
+
+from haversine import EARTH_RADIUS, distances_from_points
+from graph_snapshot import graph_file_path, distance_file_path
+
+"""
+Splits the graph into overlapping geographic shards, one per cell of a
+latitude and longitude grid. A route only visits breweries within the
+maximum distance of its home and their neighbours are within the maximum
+distance of them, so a shard holding every brewery within the fuel
+(twice the maximum distance) of its cell finds the same routes as the whole
+graph for any start point in the cell. Every shard is written into its own
+graph and distance files, which a backend loads instead of the whole graph
+"""
+class ShardMap:
+
+    def __init__(self, cell_size=30, halo=2000, shards=None):
+        self.cell_size = cell_size
+        self.halo = halo
+        self.latitude_cells = math.ceil(180 / cell_size)
+        self.longitude_cells = math.ceil(360 / cell_size)
+
+        # Node counts of the shards by name, cells without breweries in reach have no shard
+        self.shards = {} if shards is None else shards
+
+    def cell_of(self, latitude, longitude):
+
+        """
+        Returns the south west corner of the cell of the coordinates
+
+        >>> shard_map = ShardMap(cell_size=30)
+        >>> shard_map.cell_of(51.5, -0.1), shard_map.cell_of(-90, -180), shard_map.cell_of(90, 180)
+        ((30, -30), (-90, -180), (60, -180))
+        """
+
+        latitude_cell = min(max(math.floor((latitude + 90) / self.cell_size), 0), self.latitude_cells - 1)
+        longitude_cell = math.floor((longitude + 180) / self.cell_size) % self.longitude_cells
+
+        return (latitude_cell * self.cell_size - 90, longitude_cell * self.cell_size - 180)
+
+    def shard_name(self, south, west):
+
+        """
+        Names the shard after the south west corner of its cell
+
+        >>> ShardMap().shard_name(30, -90), ShardMap().shard_name(-60, 150)
+        ('n30w090', 's60e150')
+        """
+
+        return ('n' if south >= 0 else 's') + '%02d' % abs(south) + ('e' if west >= 0 else 'w') + '%03d' % abs(west)
+
+    def shard_for(self, latitude, longitude):
+
+        """
+        Returns the name of the shard that covers the start point, None if there are no breweries in its reach
+
+        >>> shard_map = ShardMap(shards={'n30e000' : 12})
+        >>> shard_map.shard_for(51.7, 19.4), shard_map.shard_for(40.7, -74)
+        ('n30e000', None)
+        """
+
+        name = self.shard_name(*self.cell_of(latitude, longitude))
+
+        return name if name in self.shards else None
+
+    def covered(self, south, west, latitudes, longitudes, step=0.25):
+
+        """
+        Returns a mask of the coordinates within the halo of the cell. Distances are measured to points
+        every step degrees along the edges of the cell, so the halo is widened by the longest distance
+        between an edge and its closest point
+
+        >>> shard_map = ShardMap(cell_size=10, halo=200)
+        >>> shard_map.covered(40, 0, [45, 45, 45, 38.5, 60], [5, 12.5, 13, -1, 5]).tolist()
+        [True, True, False, True, False]
+        """
+
+        latitudes = numpy.asarray(latitudes, dtype=numpy.float64)
+        longitudes = numpy.asarray(longitudes, dtype=numpy.float64)
+
+        north = min(south + self.cell_size, 90)
+        east = west + self.cell_size
+
+        # Nodes inside the cell are covered without measuring
+        inside = (south <= latitudes) & (latitudes <= north) & (((longitudes - west) % 360) <= self.cell_size)
+
+        steps = numpy.linspace(0, 1, int(math.ceil(self.cell_size / step)) + 1)
+
+        edge_latitudes = numpy.concatenate([south + (north - south) * steps, south + (north - south) * steps,
+                numpy.full(len(steps), south), numpy.full(len(steps), north)])
+        edge_longitudes = numpy.concatenate([numpy.full(len(steps), west), numpy.full(len(steps), east),
+                west + (east - west) * steps, west + (east - west) * steps])
+
+        # Half a step of latitude is the longest distance to a point on the edges
+        margin = math.radians(step / 2) * EARTH_RADIUS
+
+        distances = distances_from_points(edge_latitudes, edge_longitudes, latitudes, longitudes).min(axis=0)
+
+        return inside | (distances <= self.halo + margin)
+
+    def build(self, snapshot, database_directory, maximum_matrix_nodes=None):
+
+        """
+        Writes the graph and the distance file of every shard and the shard map of the database,
+        shards with more than maximum_matrix_nodes nodes don't get a distance file
+        """
+
+        self.shards = {}
+
+        for latitude_cell in range(self.latitude_cells):
+            for longitude_cell in range(self.longitude_cells):
+
+                south = latitude_cell * self.cell_size - 90
+                west = longitude_cell * self.cell_size - 180
+
+                indexes = numpy.flatnonzero(self.covered(south, west, snapshot.latitudes, snapshot.longitudes)).tolist()
+
+                if (len(indexes) == 0):
+                    continue
+
+                name = self.shard_name(south, west)
+                shard = snapshot.subset(indexes)
+
+                shard.write_file(graph_file_path(shard_database_directory(database_directory, name)))
+                shard.write_distance_file(distance_file_path(shard_database_directory(database_directory, name)), maximum_nodes=maximum_matrix_nodes)
+
+                self.shards[name] = len(indexes)
+
+        self.write_file(shard_map_path(database_directory))
+
+    def write_file(self, path):
+
+        """
+        Writes the grid and the shards into a json file
+
+        >>> ShardMap(cell_size=30, halo=2000, shards={'n30e000' : 12}).write_file('test.shards.json')
+        >>> shard_map = ShardMap()
+        >>> shard_map.load_file('test.shards.json')
+        >>> shard_map.cell_size, shard_map.halo, shard_map.shards
+        (30, 2000, {'n30e000': 12})
+        >>> os.remove('test.shards.json')
+        """
+
+        with open(path, 'w') as shard_file:
+            json.dump({'cell_size' : self.cell_size, 'halo' : self.halo, 'shards' : self.shards}, shard_file)
+
+    def load_file(self, path):
+
+        with open(path) as shard_file:
+            data = json.load(shard_file)
+
+        self.cell_size = data['cell_size']
+        self.halo = data['halo']
+        self.latitude_cells = math.ceil(180 / self.cell_size)
+        self.longitude_cells = math.ceil(360 / self.cell_size)
+        self.shards = data['shards']
+
+def rebuild_shards(snapshot, database_directory, halo, maximum_matrix_nodes=None):
+
+    """
+    Rebuilds the shards of the database with the cells of its shard map from the snapshot of the new graph,
+    so the backends don't keep serving the old one. Returns the shard map, None if the graph isn't sharded
+
+    >>> rebuild_shards(None, 'missing.db', 2000) is None
+    True
+    """
+
+    if (not os.path.isfile(shard_map_path(database_directory))):
+        return None
+
+    shard_map = ShardMap()
+    shard_map.load_file(shard_map_path(database_directory))
+    shard_map.halo = halo
+    shard_map.build(snapshot, database_directory, maximum_matrix_nodes)
+
+    return shard_map
+
+def shard_map_path(database_directory):
+    return os.path.splitext(database_directory)[0] + '.shards.json'
+
+def shard_database_directory(database_directory, name):
+
+    """
+    Returns the database directory of the shard, its graph and distance files are named after it
+
+    >>> shard_database_directory('beer.db', 'n30e000'), graph_file_path(shard_database_directory('beer.db', 'n30e000'))
+    ('beer.n30e000.db', 'beer.n30e000.graph')
+    """
+
+    root, extension = os.path.splitext(database_directory)
+
+    return root + '.' + name + extension
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,120 @@
+import math
+
+import numpy
+
+from haversine import EARTH_RADIUS, distances_from
+
+"""
+Latitude and longitude grid over the brewery coordinates, answers which
+breweries are within a radius of a point without comparing the point with
+every brewery. Points are bucketed into cells of cell_size degrees and a
+query only measures the points in the cells that overlap its bounding box
+"""
+class SpatialIndex:
+
+    def __init__(self, latitudes=[], longitudes=[], cell_size=2):
+        self.latitudes = numpy.asarray(latitudes, dtype=numpy.float64)
+        self.longitudes = numpy.asarray(longitudes, dtype=numpy.float64)
+        self.cell_size = cell_size
+        self.latitude_cells = math.ceil(180 / cell_size)
+        self.longitude_cells = math.ceil(360 / cell_size)
+        self.cells = {}
+
+        # Bucket every point into its cell
+        keys = self.cell_of(self.latitudes, self.longitudes)
+        order = numpy.argsort(keys, kind='stable')
+        keys = keys[order]
+
+        # Store indexes of the points in each cell, in ascending order
+        starts = numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]]) if len(keys) > 0 else []
+        ends = list(starts[1:]) + [len(keys)]
+
+        for start, end in zip(starts, ends):
+            self.cells[int(keys[start])] = order[start:end]
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def cell_of(self, latitudes, longitudes):
+
+        """
+        Returns the cell key of the coordinates
+
+        >>> index = SpatialIndex(cell_size=10)
+        >>> index.cell_of(numpy.array([-90, 0, 89.9]), numpy.array([-180, 5, 180])).tolist()
+        [0, 342, 612]
+        """
+
+        latitude_cell = numpy.clip(numpy.floor((latitudes + 90) / self.cell_size), 0, self.latitude_cells - 1)
+        longitude_cell = numpy.floor((longitudes + 180) / self.cell_size) % self.longitude_cells
+
+        return (latitude_cell * self.longitude_cells + longitude_cell).astype(numpy.int64)
+
+    def candidates(self, latitude, longitude, radius):
+
+        """
+        Returns indexes of the points in the cells that overlap the bounding box of the circle
+        """
+
+        # Angular radius of the circle and its height in degrees of latitude
+        angular_radius = radius / EARTH_RADIUS
+        latitude_delta = math.degrees(angular_radius)
+
+        minimum_latitude = latitude - latitude_delta
+        maximum_latitude = latitude + latitude_delta
+
+        # Near the poles or for huge circles the box spans all longitudes
+        if (minimum_latitude <= -90 or maximum_latitude >= 90 or angular_radius >= math.pi / 2):
+            first_longitude, last_longitude = 0, self.longitude_cells - 1
+        else:
+            longitude_delta = math.degrees(math.asin(min(1, math.sin(angular_radius) / math.cos(math.radians(latitude)))))
+
+            first_longitude = math.floor((longitude - longitude_delta + 180) / self.cell_size)
+            last_longitude = math.floor((longitude + longitude_delta + 180) / self.cell_size)
+
+            if (last_longitude - first_longitude + 1 >= self.longitude_cells):
+                first_longitude, last_longitude = 0, self.longitude_cells - 1
+
+        first_latitude = max(0, math.floor((minimum_latitude + 90) / self.cell_size))
+        last_latitude = min(self.latitude_cells - 1, math.floor((maximum_latitude + 90) / self.cell_size))
+
+        found = []
+
+        for latitude_cell in range(first_latitude, last_latitude + 1):
+            for longitude_cell in range(first_longitude, last_longitude + 1):
+
+                key = latitude_cell * self.longitude_cells + longitude_cell % self.longitude_cells
+
+                if (key in self.cells):
+                    found.append(self.cells[key])
+
+        if (len(found) == 0):
+            return numpy.zeros(0, dtype=numpy.int64)
+
+        return numpy.sort(numpy.concatenate(found))
+
+    def within(self, latitude, longitude, radius):
+
+        """
+        Finds the points that are within the radius of the coordinate
+        Returns their indexes in ascending order and the distances to them
+
+        >>> index = SpatialIndex([34, 34, 40, -33], [2, 14, 10, 151], cell_size=5)
+        >>> indexes, distances = index.within(35, 2, 1000)
+        >>> indexes.tolist(), distances.tolist()
+        ([0, 2], [111.195, 897.772])
+        >>> index.within(89, 0, 6500)[0].tolist()
+        [0, 1, 2]
+        """
+
+        indexes = self.candidates(latitude, longitude, radius)
+
+        distances = distances_from(latitude, longitude, self.latitudes[indexes], self.longitudes[indexes])
+
+        close = distances <= radius
+
+        return indexes[close], distances[close]
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -4,6 +4,7 @@ import Row from 'react-bootstrap/Row';
 import Col from 'react-bootstrap/Col';
 import InputGroup from 'react-bootstrap/InputGroup';
 import FormControl from 'react-bootstrap/FormControl';
+import Form from 'react-bootstrap/Form';
 import Button from 'react-bootstrap/Button';
 import Container from 'react-bootstrap/Container';
 import Accordion from 'react-bootstrap/Accordion';
@@ -23,24 +24,21 @@ class App extends React.Component {
             lat : React.createRef(),
             long: React.createRef(),
             numberOfRuns : React.createRef(),
+            stream : React.createRef(),
             distance : []
         };
     }
 
     findPath() {
-        fetch(`/api/find-path/${ this.state.lat.current.value }/${ this.state.long.current.value }/${ this.state.numberOfRuns.current.value }`)
-            .then(res => res.json())
-            .then(
-                (result) => {
-                    this.setState({
-                        beer : result['beer'],
-                        breweries : result['breweries'],
-                        distance : result['distance']
-                    })
 
+        // Streamed searches show the routes as they are found, but run as a single job instead of in parallel
+        const stream = this.state.stream.current.checked ? '?stream=1' : '';
 
-                },
+        this.routeShown = false;
 
+        fetch(`/api/find-path/${ this.state.lat.current.value }/${ this.state.long.current.value }/${ this.state.numberOfRuns.current.value }${ stream }`)
+            .then(res => this.readRecords(res, (result) => this.showResult(result)))
+            .catch(
                 (error) => {
                     this.setState({
                         beer : [],
@@ -53,6 +51,55 @@ class App extends React.Component {
             );
     }
 
+    // Reads the json lines of the streamed search, the improved routes arrive first and the final one last.
+    // Responses that aren't streamed are a single json object without a line break
+    readRecords(res, onRecord) {
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        const read = () => reader.read().then(({ done, value }) => {
+            buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+
+            const lines = buffer.split('\n');
+            buffer = done ? '' : lines.pop();
+
+            lines.filter(line => line.trim() !== '').forEach(line => onRecord(JSON.parse(line)));
+
+            if (!done) {
+                return read();
+            }
+        });
+
+        return read();
+    }
+
+    showResult(result) {
+
+        // Server had no free search worker, a route of the search that is already shown is kept
+        if (result['busy'] && this.routeShown) {
+            return
+        }
+
+        if (result['busy']) {
+            this.setState({
+                beer : [],
+                breweries : ['Server is busy, try again'],
+                distance : []
+            })
+
+            return
+        }
+
+        this.routeShown = true;
+
+        this.setState({
+            beer : result['beer'],
+            breweries : result['breweries'],
+            distance : result['distance']
+        })
+    }
+
     render() {
         return (
             <Container fluid className="h-100">
@@ -96,6 +143,15 @@ class App extends React.Component {
                                 </InputGroup>
                             
                         </Col>
+                        <Col md={1} className="mb-3 d-flex align-items-center">
+                            <Form.Check
+                              type="checkbox"
+                              id="stream"
+                              label="Progress"
+                              className="text-light"
+                              ref={ this.state.stream }
+                            />
+                        </Col>
                         <Col md={1} className="mb-3">
                             <Button variant="outline-light" onClick={ (e) => this.findPath(e) }>Find route</Button>
                         </Col>